@@ -0,0 +1,44 @@
+"""
+Regression check of the generated kernel against PySD.
+
+Runs the translated model (src/model.py) with PySD and the batch engine,
+which evaluates src/model_kernel.py, at the tax levels of
+codegen.CHECK_TAXES and compares every variable. Exits with status 1 if a
+variable differs by more than the tolerance, or if the kernel is out of date
+with vensim/model.mdl.
+
+    python benchmarks/kernel_check.py [--rtol 1e-9]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rtol", type=float, default=1e-9,
+                        help="Tolerance relative to each variable's largest magnitude")
+    args = parser.parse_args(argv)
+
+    import pysd
+    from src.utils.codegen import CHECK_TAXES, check_kernel
+
+    model = pysd.load(str(BASE_DIR / "src" / "model.py"))
+    try:
+        mismatches = check_kernel(model, rtol=args.rtol)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    for mismatch in mismatches:
+        print(f"Mismatch: {mismatch}")
+    if not mismatches:
+        print(f"Kernel matches PySD at taxes {CHECK_TAXES}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Import-time and startup benchmark.
+
+Every measurement runs in a fresh interpreter, so it includes the imports a
+script or a worker process pays before its first simulation. The compute
+modules must not import matplotlib or PySD; the script exits with status 1
+if one does, or if a measurement exceeds its budget.
+
+    python benchmarks/startup.py [--repeat 3] [--budget-scale 1.0]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+# Modules meant for scripted and batch use
+COMPUTE_MODULES = [
+    "src.utils.batch",
+    "src.utils.summary",
+    "src.utils.max_tax",
+    "src.utils.tax_adjustment",
+    "src.utils.steady_state",
+    "src.utils.jit",
+    "src.utils.integrate",
+    "src.utils.sweep",
+]
+
+FORBIDDEN_MODULES = ["matplotlib", "pysd"]
+
+# Code timed in a fresh interpreter, with its budget in seconds
+SCENARIOS = {
+    **{
+        f"import {module}": (f"import {module}", 1.5)
+        for module in COMPUTE_MODULES
+    },
+    "first batch run (KernelModel)": (
+        "from src.utils.codegen import KernelModel\n"
+        "from src.utils.summary import summarize_batch\n"
+        "summarize_batch(KernelModel(), {'carbon_tax_rate': [0.0, 1000.0]})",
+        2.0,
+    ),
+    "first PySD run (pysd.load)": (
+        "import pysd\n"
+        "pysd.load('src/model.py').run()",
+        4.0,
+    ),
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile({code!r}, "<benchmark>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "modules": sorted(name for name in {forbidden!r} if name in sys.modules),
+}}))
+"""
+
+
+def measure(code: str, repeat: int = 3) -> Dict:
+    """
+    Best wall time of code over `repeat` fresh interpreters, and the
+    forbidden modules it imported.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(code=code, forbidden=FORBIDDEN_MODULES)],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        "seconds": min(run["seconds"] for run in runs),
+        "modules": runs[0]["modules"],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--budget-scale", type=float, default=1.0,
+        help="Multiply every time budget, e.g. on slow machines",
+    )
+    args = parser.parse_args(argv)
+
+    failures = []
+    for name, (code, budget) in SCENARIOS.items():
+        result = measure(code, args.repeat)
+        budget *= args.budget_scale
+        status = "ok"
+        if result["seconds"] > budget:
+            status = f"over budget ({budget:.2f} s)"
+        if name.startswith("import") and result["modules"]:
+            status = f"imports {', '.join(result['modules'])}"
+        if status != "ok":
+            failures.append(name)
+        print(f"{name:40s} {result['seconds']:8.3f} s  {status}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
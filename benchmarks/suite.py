@@ -0,0 +1,286 @@
+"""
+Benchmark suite for the model and the analysis utilities.
+
+Times the notebook workloads with fixed parameter sets and seeds and writes,
+per benchmark, the best wall time, the number of PySD model runs, runs per
+second, peak traced memory and a summary of the results to JSON. Given the
+JSON of an earlier commit, it exits with status 1 if a benchmark got slower
+(or used more memory) by more than the threshold, and reports changed
+results.
+
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --baseline bench.json --threshold 0.2
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict
+
+import numpy as np
+import yaml
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+SEED = 0
+
+RETURN_COLUMNS = ["cumulative_co2", "cumulative_profit", "viability_flag"]
+
+# Subsystem parameters of notebooks/subsystem_sensitivity.ipynb
+SUBSYSTEM_PARAMS = {
+    "baseline_ci": np.linspace(0.00268 * 0.85, 0.00268 * 1.05, 5),
+    "carbon_content_of_fuel": np.linspace(0.00268 * 0.90, 0.00268 * 1.00, 5),
+    "max_reduction_ci": np.linspace(0.30, 0.60, 5),
+    "tax_scale": np.linspace(2000, 5000, 5),
+    "baseline_fuel_efficiency": np.linspace(2.84 * 0.85, 2.84 * 1.10, 5),
+    "max_efficiency": np.linspace(1.15, 1.40, 5),
+    "cost_pressure_sensitivity": np.linspace(0.3, 1.0, 5),
+    "cost_pressure_at_max_improvement": np.linspace(0.7, 1.3, 5),
+    "nonfuel_cost_per_km": np.linspace(90 * 0.70, 90 * 1.05, 5),
+    "pretax_fuel_price": np.linspace(108 * 0.80, 108 * 1.20, 5),
+    "desired_passthrough_share": np.linspace(0.30, 0.80, 5),
+    "baseline_demand": np.linspace(19e9 * 0.9, 19e9 * 1.10, 5),
+    "elasticity_sr": np.linspace(-0.30, -0.10, 5),
+    "elasticity_lr": np.linspace(-1.00, -0.40, 5),
+}
+
+# Tax levels of the notebook: linspace(289, frontier, 5) without 1447 and 3763
+SENSITIVITY_TAX_LEVELS = [289.0, 2605.0, 4921.0]
+
+TRADEOFF_TAXES = np.linspace(0, 6500, 40)
+
+# Static tax frontier of params.yaml, used as the cap of the step rule
+TAX_FRONTIER = 4921
+
+
+def _single_run(model, params):
+    result = model.run(params=params, return_columns=RETURN_COLUMNS)
+    return {name: float(result[name].iloc[-1]) for name in RETURN_COLUMNS}
+
+
+def _max_viable_tax(model, params):
+    from src.utils.max_tax import calculate_max_viable_tax
+    return {"max_viable_tax": float(calculate_max_viable_tax(model, params))}
+
+
+def _sensitivity(model, params):
+    from src.utils.sensitivity import one_at_a_time_sensitivity_analysis
+    results = one_at_a_time_sensitivity_analysis(
+        model, dict(params), SUBSYSTEM_PARAMS, SENSITIVITY_TAX_LEVELS
+    )
+    return {
+        "rows": len(results),
+        "co2_reduction_pct_sum": float(results["co2_reduction_pct"].sum()),
+        "profit_change_pct_sum": float(results["profit_change_pct"].sum()),
+        "viable": int(results["viable"].sum()),
+    }
+
+
+def _tradeoff_sweep(model, params):
+    co2, profit, viable = [], [], []
+    for tax in TRADEOFF_TAXES:
+        result = model.run(
+            params=dict(params, carbon_tax_rate=tax), return_columns=RETURN_COLUMNS
+        )
+        co2.append(result["cumulative_co2"].iloc[-1])
+        profit.append(result["cumulative_profit"].iloc[-1])
+        viable.append(result["viability_flag"].iloc[-1])
+    return {
+        "co2_sum": float(np.sum(co2)),
+        "profit_sum": float(np.sum(profit)),
+        "viable": int(np.sum(viable)),
+    }
+
+
+def _target_emissions(t):
+    # Cumulative emissions of a path 30% below the baseline monthly rate
+    return 0.7 * 1.76e7 * t
+
+
+ADAPTIVE_RULES = {
+    "step_increase": ("step_increase_rule", {"step_size": 240, "max_tax": TAX_FRONTIER}),
+    "percentage_growth": ("percentage_growth_rule", {"annual_growth_rate": 0.1}),
+    "margin_based": ("margin_based_rule", {
+        "target_margin": 0.02, "margin_band": 0.01,
+        "tax_increase": 200, "tax_decrease": 100,
+    }),
+    "emission_path": ("emission_path_rule", {
+        "target_emissions_func": _target_emissions, "emission_band": 1e7,
+        "tax_increase": 200, "tax_decrease": 100,
+    }),
+}
+
+
+def _adaptive(rule):
+    def benchmark(model, params):
+        from src.utils import tax_adjustment
+        name, kwargs = ADAPTIVE_RULES[rule]
+        result = tax_adjustment.compare_adaptive_tax_vs_static(
+            model, dict(params), getattr(tax_adjustment, name), **kwargs
+        )
+        return {
+            "time_avg_tax": float(result["time_avg_tax"]),
+            "viability_adaptive": int(result["viability_adaptive"]),
+            "viability_static": int(result["viability_static"]),
+        }
+    return benchmark
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "single_run": _single_run,
+    "calculate_max_viable_tax": _max_viable_tax,
+    "one_at_a_time_sensitivity": _sensitivity,
+    "tradeoff_sweep_40": _tradeoff_sweep,
+    **{f"adaptive_{rule}": _adaptive(rule) for rule in ADAPTIVE_RULES},
+}
+
+
+@contextmanager
+def _count_runs(model):
+    """
+    Count the PySD runs (model.run and model.set_stepper calls) of a block.
+    """
+    counter = {"runs": 0}
+    originals = {name: getattr(model, name) for name in ("run", "set_stepper")}
+
+    def counted(method):
+        def wrapper(*args, **kwargs):
+            counter["runs"] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name, method in originals.items():
+        setattr(model, name, counted(method))
+    try:
+        yield counter
+    finally:
+        for name in originals:
+            delattr(model, name)
+
+
+def run_benchmark(benchmark: Callable, load_model: Callable, params: Dict,
+                  repeat: int = 3) -> Dict:
+    """
+    Best wall time over `repeat` runs, then one traced run for peak memory.
+    Every run gets a freshly loaded model, since PySD keeps the params of
+    earlier runs.
+    """
+    times = []
+    for _ in range(repeat):
+        model = load_model()
+        random.seed(SEED)
+        np.random.seed(SEED)
+        with _count_runs(model) as counter:
+            start = time.perf_counter()
+            result = benchmark(model, params)
+            times.append(time.perf_counter() - start)
+
+    model = load_model()
+    random.seed(SEED)
+    np.random.seed(SEED)
+    tracemalloc.start()
+    try:
+        benchmark(model, params)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    seconds = min(times)
+    return {
+        "seconds": seconds,
+        "runs": counter["runs"],
+        "runs_per_sec": counter["runs"] / seconds,
+        "peak_memory_mb": peak / 2**20,
+        "result": result,
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.2, rtol: float = 1e-6):
+    """
+    Names of the benchmarks slower or using more memory than in baseline by
+    more than threshold (relative), and of those whose results changed.
+    """
+    regressions, changed = [], []
+    for name, entry in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        if (entry["seconds"] > before["seconds"] * (1 + threshold)
+                or entry["peak_memory_mb"] > before["peak_memory_mb"] * (1 + threshold)):
+            regressions.append(name)
+        for key, value in entry["result"].items():
+            if not np.isclose(value, before["result"].get(key, np.nan), rtol=rtol):
+                changed.append(name)
+                break
+    return regressions, changed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="JSON file to write the measurements to")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Tolerated relative slowdown (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS),
+                        help="Run only these benchmarks")
+    args = parser.parse_args(argv)
+
+    import pysd
+
+    def load_model():
+        return pysd.load(str(BASE_DIR / "src" / "model.py"))
+
+    with open(BASE_DIR / "params.yaml") as f:
+        params = yaml.safe_load(f)
+
+    report = {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pysd": pysd.__version__,
+        "benchmarks": {},
+    }
+    for name in args.only or BENCHMARKS:
+        entry = run_benchmark(BENCHMARKS[name], load_model, params, args.repeat)
+        report["benchmarks"][name] = entry
+        print(f"{name:30s} {entry['seconds']:9.3f} s {entry['runs']:6d} runs "
+              f"{entry['runs_per_sec']:9.1f} runs/s {entry['peak_memory_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, changed = compare(report, baseline, args.threshold)
+        for name in changed:
+            print(f"Results changed: {name}")
+        for name in regressions:
+            print(f"Regression beyond {args.threshold:.0%}: {name}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
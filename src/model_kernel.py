@@ -0,0 +1,411 @@
+"""
+Batched NumPy kernel generated from model.mdl by
+src/utils/codegen.py. Do not edit: it is regenerated whenever the .mdl
+changes.
+
+Every value is a scalar or an array of shape (n_scenarios,), except
+in run_scenarios, which loops over scenarios on Python floats.
+"""
+
+import math
+import numpy as np
+
+# Replaced by numba.prange when run_scenarios is compiled
+prange = range
+
+MDL_DIGEST = '264b847e2526261c86866b54d70019f8f21e81955d8e03e72f99f689975c3ff8'
+
+CONTROL = {
+    'initial_time': 0.0,
+    'final_time': 120.0,
+    'time_step': 1.0,
+    'saveper': 1.0,
+}
+
+CONSTANTS = {
+    'baseline_ci': 0.00268,
+    'baseline_demand': 19000000000.0,
+    'baseline_fuel_efficiency': 2.84,
+    'baseline_margin': 0.05,
+    'carbon_content_of_fuel': 0.00268,
+    'carbon_tax_rate': 289.0,
+    'cost_pressure_at_max_improvement': 1.0,
+    'cost_pressure_sensitivity': 0.2,
+    'degradation_rate': 0.0,
+    'desired_passthrough_share': 0.5,
+    'duration_threshold': 6.0,
+    'elasticity_lr': -0.6,
+    'elasticity_sr': -0.2,
+    'freight_activity_growth_rate': 0.0,
+    'margin_threshold': 0.02,
+    'max_efficiency': 1.25,
+    'max_reduction_ci': 0.45,
+    'nonfuel_cost_per_km': 90.0,
+    'pretax_fuel_price': 108.0,
+    'tau_ci': 120.0,
+    'tau_eff': 36.0,
+    'tau_lr': 24.0,
+    'tau_m': 12.0,
+    'tau_p': 6.0,
+    'tau_sr': 3.0,
+    'tax_scale': 3000.0,
+}
+
+RUN_CONSTANTS = ['baseline_fuel_cost_per_km', 'target_carbon_intensity', 'tax_per_liter', 'baseline_operating_cost_per_km', 'fuel_price', 'baseline_margin_per_km', 'baseline_freight_price']
+
+STOCKS = ['average_fuel_efficiency', 'carbon_intensity_of_fuel', 'cumulative_co2', 'cumulative_profit', 'duration_below_margin_threshold', 'effective_passthrough_share', 'longrun_price_effect_on_demand', 'perceived_freight_price', 'rolling_margin', 'shortrun_price_effect_on_demand', 'underlying_freight_activity']
+
+AUXILIARIES = ['actual_freight_price', 'ci_adjustment', 'cost_pressure_on_efficiency', 'degradation', 'efficiency_target', 'emissions', 'extra_fuel_cost_per_km', 'freight_activity', 'freight_demand', 'fuel_consumption', 'fuel_cost_per_km', 'improvement', 'margin', 'operating_cost_per_km', 'operating_expenses', 'profit', 'revenue', 'viability_flag']
+
+# Columns of the constants and outputs of run_scenarios
+FOLDED = ['baseline_ci', 'baseline_demand', 'baseline_fuel_efficiency', 'baseline_margin', 'carbon_content_of_fuel', 'carbon_tax_rate', 'cost_pressure_at_max_improvement', 'cost_pressure_sensitivity', 'degradation_rate', 'desired_passthrough_share', 'duration_threshold', 'elasticity_lr', 'elasticity_sr', 'freight_activity_growth_rate', 'margin_threshold', 'max_efficiency', 'max_reduction_ci', 'nonfuel_cost_per_km', 'pretax_fuel_price', 'tau_ci', 'tau_eff', 'tau_lr', 'tau_m', 'tau_p', 'tau_sr', 'tax_scale', 'baseline_fuel_cost_per_km', 'target_carbon_intensity', 'tax_per_liter', 'baseline_operating_cost_per_km', 'fuel_price', 'baseline_margin_per_km', 'baseline_freight_price']
+
+VARIABLES = STOCKS + AUXILIARIES
+
+
+def fold_constants(k):
+    """
+    Constants extended with the auxiliaries that only depend on them.
+    """
+    k = dict(k)
+    baseline_ci = k['baseline_ci']
+    baseline_fuel_efficiency = k['baseline_fuel_efficiency']
+    baseline_margin = k['baseline_margin']
+    carbon_content_of_fuel = k['carbon_content_of_fuel']
+    carbon_tax_rate = k['carbon_tax_rate']
+    max_reduction_ci = k['max_reduction_ci']
+    nonfuel_cost_per_km = k['nonfuel_cost_per_km']
+    pretax_fuel_price = k['pretax_fuel_price']
+    tax_scale = k['tax_scale']
+    baseline_fuel_cost_per_km = (pretax_fuel_price / baseline_fuel_efficiency)
+    target_carbon_intensity = (baseline_ci * (1.0 - (max_reduction_ci * (1.0 - np.exp(((-carbon_tax_rate) / tax_scale))))))
+    tax_per_liter = (carbon_tax_rate * carbon_content_of_fuel)
+    baseline_operating_cost_per_km = (nonfuel_cost_per_km + baseline_fuel_cost_per_km)
+    fuel_price = (pretax_fuel_price + tax_per_liter)
+    baseline_margin_per_km = (baseline_margin * baseline_operating_cost_per_km)
+    baseline_freight_price = (baseline_operating_cost_per_km + baseline_margin_per_km)
+    k['baseline_fuel_cost_per_km'] = baseline_fuel_cost_per_km
+    k['target_carbon_intensity'] = target_carbon_intensity
+    k['tax_per_liter'] = tax_per_liter
+    k['baseline_operating_cost_per_km'] = baseline_operating_cost_per_km
+    k['fuel_price'] = fuel_price
+    k['baseline_margin_per_km'] = baseline_margin_per_km
+    k['baseline_freight_price'] = baseline_freight_price
+    return k
+
+
+def initial_stocks(k, time=0):
+    """
+    Initial value of every stock, for folded constants k.
+    """
+    baseline_ci = k['baseline_ci']
+    baseline_demand = k['baseline_demand']
+    baseline_freight_price = k['baseline_freight_price']
+    baseline_fuel_cost_per_km = k['baseline_fuel_cost_per_km']
+    baseline_fuel_efficiency = k['baseline_fuel_efficiency']
+    desired_passthrough_share = k['desired_passthrough_share']
+    elasticity_lr = k['elasticity_lr']
+    elasticity_sr = k['elasticity_sr']
+    fuel_price = k['fuel_price']
+    nonfuel_cost_per_km = k['nonfuel_cost_per_km']
+    average_fuel_efficiency = baseline_fuel_efficiency
+    carbon_intensity_of_fuel = baseline_ci
+    cumulative_co2 = 0.0
+    cumulative_profit = 0.0
+    duration_below_margin_threshold = 0.0
+    effective_passthrough_share = desired_passthrough_share
+    underlying_freight_activity = baseline_demand
+    fuel_cost_per_km = (fuel_price / average_fuel_efficiency)
+    extra_fuel_cost_per_km = (fuel_cost_per_km - baseline_fuel_cost_per_km)
+    operating_cost_per_km = (nonfuel_cost_per_km + fuel_cost_per_km)
+    actual_freight_price = (baseline_freight_price + (effective_passthrough_share * extra_fuel_cost_per_km))
+    perceived_freight_price = actual_freight_price
+    longrun_price_effect_on_demand = ((underlying_freight_activity * ((perceived_freight_price / baseline_freight_price) ** elasticity_lr)) - underlying_freight_activity)
+    shortrun_price_effect_on_demand = ((underlying_freight_activity * ((perceived_freight_price / baseline_freight_price) ** elasticity_sr)) - underlying_freight_activity)
+    freight_demand = (underlying_freight_activity + shortrun_price_effect_on_demand + longrun_price_effect_on_demand)
+    freight_activity = freight_demand
+    operating_expenses = (freight_activity * operating_cost_per_km)
+    revenue = (freight_activity * perceived_freight_price)
+    profit = (revenue - operating_expenses)
+    margin = (profit / revenue)
+    rolling_margin = margin
+    return {
+        'average_fuel_efficiency': average_fuel_efficiency,
+        'carbon_intensity_of_fuel': carbon_intensity_of_fuel,
+        'cumulative_co2': cumulative_co2,
+        'cumulative_profit': cumulative_profit,
+        'duration_below_margin_threshold': duration_below_margin_threshold,
+        'effective_passthrough_share': effective_passthrough_share,
+        'longrun_price_effect_on_demand': longrun_price_effect_on_demand,
+        'perceived_freight_price': perceived_freight_price,
+        'rolling_margin': rolling_margin,
+        'shortrun_price_effect_on_demand': shortrun_price_effect_on_demand,
+        'underlying_freight_activity': underlying_freight_activity,
+    }
+
+
+def auxiliaries(k, s, time=0):
+    """
+    Every auxiliary that changes over time, at the stocks s.
+    """
+    baseline_freight_price = k['baseline_freight_price']
+    baseline_fuel_cost_per_km = k['baseline_fuel_cost_per_km']
+    cost_pressure_at_max_improvement = k['cost_pressure_at_max_improvement']
+    cost_pressure_sensitivity = k['cost_pressure_sensitivity']
+    degradation_rate = k['degradation_rate']
+    duration_threshold = k['duration_threshold']
+    fuel_price = k['fuel_price']
+    max_efficiency = k['max_efficiency']
+    nonfuel_cost_per_km = k['nonfuel_cost_per_km']
+    target_carbon_intensity = k['target_carbon_intensity']
+    tau_ci = k['tau_ci']
+    tau_eff = k['tau_eff']
+    average_fuel_efficiency = s['average_fuel_efficiency']
+    carbon_intensity_of_fuel = s['carbon_intensity_of_fuel']
+    cumulative_profit = s['cumulative_profit']
+    duration_below_margin_threshold = s['duration_below_margin_threshold']
+    effective_passthrough_share = s['effective_passthrough_share']
+    longrun_price_effect_on_demand = s['longrun_price_effect_on_demand']
+    perceived_freight_price = s['perceived_freight_price']
+    shortrun_price_effect_on_demand = s['shortrun_price_effect_on_demand']
+    underlying_freight_activity = s['underlying_freight_activity']
+    ci_adjustment = ((target_carbon_intensity - carbon_intensity_of_fuel) / tau_ci)
+    degradation = (average_fuel_efficiency * degradation_rate)
+    freight_demand = (underlying_freight_activity + shortrun_price_effect_on_demand + longrun_price_effect_on_demand)
+    fuel_cost_per_km = (fuel_price / average_fuel_efficiency)
+    viability_flag = np.where(((duration_below_margin_threshold > duration_threshold) | (cumulative_profit < 0.0)), 0.0, 1.0)
+    cost_pressure_on_efficiency = (cost_pressure_sensitivity * ((fuel_cost_per_km / baseline_fuel_cost_per_km) - 1.0))
+    extra_fuel_cost_per_km = (fuel_cost_per_km - baseline_fuel_cost_per_km)
+    freight_activity = freight_demand
+    operating_cost_per_km = (nonfuel_cost_per_km + fuel_cost_per_km)
+    actual_freight_price = (baseline_freight_price + (effective_passthrough_share * extra_fuel_cost_per_km))
+    efficiency_target = np.minimum((average_fuel_efficiency * max_efficiency), (average_fuel_efficiency * (1.0 + ((max_efficiency - 1.0) * (cost_pressure_on_efficiency / (cost_pressure_on_efficiency + cost_pressure_at_max_improvement))))))
+    fuel_consumption = (freight_activity / average_fuel_efficiency)
+    operating_expenses = (freight_activity * operating_cost_per_km)
+    revenue = (freight_activity * perceived_freight_price)
+    emissions = (fuel_consumption * carbon_intensity_of_fuel)
+    improvement = ((efficiency_target - average_fuel_efficiency) / tau_eff)
+    profit = (revenue - operating_expenses)
+    margin = (profit / revenue)
+    return {
+        'actual_freight_price': actual_freight_price,
+        'ci_adjustment': ci_adjustment,
+        'cost_pressure_on_efficiency': cost_pressure_on_efficiency,
+        'degradation': degradation,
+        'efficiency_target': efficiency_target,
+        'emissions': emissions,
+        'extra_fuel_cost_per_km': extra_fuel_cost_per_km,
+        'freight_activity': freight_activity,
+        'freight_demand': freight_demand,
+        'fuel_consumption': fuel_consumption,
+        'fuel_cost_per_km': fuel_cost_per_km,
+        'improvement': improvement,
+        'margin': margin,
+        'operating_cost_per_km': operating_cost_per_km,
+        'operating_expenses': operating_expenses,
+        'profit': profit,
+        'revenue': revenue,
+        'viability_flag': viability_flag,
+    }
+
+
+def derivatives(k, s, a, time=0):
+    """
+    Net flow of every stock, at the stocks s and auxiliaries a.
+    """
+    baseline_freight_price = k['baseline_freight_price']
+    desired_passthrough_share = k['desired_passthrough_share']
+    elasticity_lr = k['elasticity_lr']
+    elasticity_sr = k['elasticity_sr']
+    freight_activity_growth_rate = k['freight_activity_growth_rate']
+    margin_threshold = k['margin_threshold']
+    tau_lr = k['tau_lr']
+    tau_m = k['tau_m']
+    tau_p = k['tau_p']
+    tau_sr = k['tau_sr']
+    effective_passthrough_share = s['effective_passthrough_share']
+    longrun_price_effect_on_demand = s['longrun_price_effect_on_demand']
+    perceived_freight_price = s['perceived_freight_price']
+    rolling_margin = s['rolling_margin']
+    shortrun_price_effect_on_demand = s['shortrun_price_effect_on_demand']
+    underlying_freight_activity = s['underlying_freight_activity']
+    actual_freight_price = a['actual_freight_price']
+    ci_adjustment = a['ci_adjustment']
+    degradation = a['degradation']
+    emissions = a['emissions']
+    improvement = a['improvement']
+    margin = a['margin']
+    profit = a['profit']
+    d_average_fuel_efficiency = (improvement - degradation)
+    d_carbon_intensity_of_fuel = ci_adjustment
+    d_cumulative_co2 = emissions
+    d_cumulative_profit = profit
+    d_duration_below_margin_threshold = np.where((rolling_margin < margin_threshold), 1.0, 0.0)
+    d_effective_passthrough_share = ((desired_passthrough_share - effective_passthrough_share) / tau_p)
+    _cse0 = (perceived_freight_price / baseline_freight_price)
+    d_longrun_price_effect_on_demand = ((((underlying_freight_activity * (_cse0 ** elasticity_lr)) - underlying_freight_activity) - longrun_price_effect_on_demand) / tau_lr)
+    d_perceived_freight_price = ((actual_freight_price - perceived_freight_price) / tau_p)
+    d_rolling_margin = ((margin - rolling_margin) / tau_m)
+    d_shortrun_price_effect_on_demand = ((((underlying_freight_activity * (_cse0 ** elasticity_sr)) - underlying_freight_activity) - shortrun_price_effect_on_demand) / tau_sr)
+    d_underlying_freight_activity = (freight_activity_growth_rate * underlying_freight_activity)
+    return {
+        'average_fuel_efficiency': d_average_fuel_efficiency,
+        'carbon_intensity_of_fuel': d_carbon_intensity_of_fuel,
+        'cumulative_co2': d_cumulative_co2,
+        'cumulative_profit': d_cumulative_profit,
+        'duration_below_margin_threshold': d_duration_below_margin_threshold,
+        'effective_passthrough_share': d_effective_passthrough_share,
+        'longrun_price_effect_on_demand': d_longrun_price_effect_on_demand,
+        'perceived_freight_price': d_perceived_freight_price,
+        'rolling_margin': d_rolling_margin,
+        'shortrun_price_effect_on_demand': d_shortrun_price_effect_on_demand,
+        'underlying_freight_activity': d_underlying_freight_activity,
+    }
+
+
+def run_scenarios(K, S0, initialize, t0, n_steps, dt, save_every, columns, out):
+    """
+    Euler loop of each scenario. Row r of K holds its folded constants
+    (FOLDED order) and row r of S0 its stocks at t0 (STOCKS order),
+    which are computed instead if initialize is true. Variable
+    VARIABLES[columns[m]] at the j-th saved step is written to
+    out[r, j, m].
+    """
+    for r in prange(K.shape[0]):
+        v = np.empty(29)
+        baseline_ci = K[r, 0]
+        baseline_demand = K[r, 1]
+        baseline_freight_price = K[r, 32]
+        baseline_fuel_cost_per_km = K[r, 26]
+        baseline_fuel_efficiency = K[r, 2]
+        cost_pressure_at_max_improvement = K[r, 6]
+        cost_pressure_sensitivity = K[r, 7]
+        degradation_rate = K[r, 8]
+        desired_passthrough_share = K[r, 9]
+        duration_threshold = K[r, 10]
+        elasticity_lr = K[r, 11]
+        elasticity_sr = K[r, 12]
+        freight_activity_growth_rate = K[r, 13]
+        fuel_price = K[r, 30]
+        margin_threshold = K[r, 14]
+        max_efficiency = K[r, 15]
+        nonfuel_cost_per_km = K[r, 17]
+        target_carbon_intensity = K[r, 27]
+        tau_ci = K[r, 19]
+        tau_eff = K[r, 20]
+        tau_lr = K[r, 21]
+        tau_m = K[r, 22]
+        tau_p = K[r, 23]
+        tau_sr = K[r, 24]
+        time = t0
+        if initialize:
+            average_fuel_efficiency = baseline_fuel_efficiency
+            carbon_intensity_of_fuel = baseline_ci
+            cumulative_co2 = 0.0
+            cumulative_profit = 0.0
+            duration_below_margin_threshold = 0.0
+            effective_passthrough_share = desired_passthrough_share
+            underlying_freight_activity = baseline_demand
+            fuel_cost_per_km = (fuel_price / average_fuel_efficiency)
+            extra_fuel_cost_per_km = (fuel_cost_per_km - baseline_fuel_cost_per_km)
+            operating_cost_per_km = (nonfuel_cost_per_km + fuel_cost_per_km)
+            actual_freight_price = (baseline_freight_price + (effective_passthrough_share * extra_fuel_cost_per_km))
+            perceived_freight_price = actual_freight_price
+            longrun_price_effect_on_demand = ((underlying_freight_activity * ((perceived_freight_price / baseline_freight_price) ** elasticity_lr)) - underlying_freight_activity)
+            shortrun_price_effect_on_demand = ((underlying_freight_activity * ((perceived_freight_price / baseline_freight_price) ** elasticity_sr)) - underlying_freight_activity)
+            freight_demand = (underlying_freight_activity + shortrun_price_effect_on_demand + longrun_price_effect_on_demand)
+            freight_activity = freight_demand
+            operating_expenses = (freight_activity * operating_cost_per_km)
+            revenue = (freight_activity * perceived_freight_price)
+            profit = (revenue - operating_expenses)
+            margin = (profit / revenue)
+            rolling_margin = margin
+        else:
+            average_fuel_efficiency = S0[r, 0]
+            carbon_intensity_of_fuel = S0[r, 1]
+            cumulative_co2 = S0[r, 2]
+            cumulative_profit = S0[r, 3]
+            duration_below_margin_threshold = S0[r, 4]
+            effective_passthrough_share = S0[r, 5]
+            longrun_price_effect_on_demand = S0[r, 6]
+            perceived_freight_price = S0[r, 7]
+            rolling_margin = S0[r, 8]
+            shortrun_price_effect_on_demand = S0[r, 9]
+            underlying_freight_activity = S0[r, 10]
+        for i in range(n_steps + 1):
+            time = t0 + i * dt
+            ci_adjustment = ((target_carbon_intensity - carbon_intensity_of_fuel) / tau_ci)
+            degradation = (average_fuel_efficiency * degradation_rate)
+            freight_demand = (underlying_freight_activity + shortrun_price_effect_on_demand + longrun_price_effect_on_demand)
+            fuel_cost_per_km = (fuel_price / average_fuel_efficiency)
+            viability_flag = (0.0 if ((duration_below_margin_threshold > duration_threshold) | (cumulative_profit < 0.0)) else 1.0)
+            cost_pressure_on_efficiency = (cost_pressure_sensitivity * ((fuel_cost_per_km / baseline_fuel_cost_per_km) - 1.0))
+            extra_fuel_cost_per_km = (fuel_cost_per_km - baseline_fuel_cost_per_km)
+            freight_activity = freight_demand
+            operating_cost_per_km = (nonfuel_cost_per_km + fuel_cost_per_km)
+            actual_freight_price = (baseline_freight_price + (effective_passthrough_share * extra_fuel_cost_per_km))
+            efficiency_target = min((average_fuel_efficiency * max_efficiency), (average_fuel_efficiency * (1.0 + ((max_efficiency - 1.0) * (cost_pressure_on_efficiency / (cost_pressure_on_efficiency + cost_pressure_at_max_improvement))))))
+            fuel_consumption = (freight_activity / average_fuel_efficiency)
+            operating_expenses = (freight_activity * operating_cost_per_km)
+            revenue = (freight_activity * perceived_freight_price)
+            emissions = (fuel_consumption * carbon_intensity_of_fuel)
+            improvement = ((efficiency_target - average_fuel_efficiency) / tau_eff)
+            profit = (revenue - operating_expenses)
+            margin = (profit / revenue)
+            if i % save_every == 0:
+                v[0] = average_fuel_efficiency
+                v[1] = carbon_intensity_of_fuel
+                v[2] = cumulative_co2
+                v[3] = cumulative_profit
+                v[4] = duration_below_margin_threshold
+                v[5] = effective_passthrough_share
+                v[6] = longrun_price_effect_on_demand
+                v[7] = perceived_freight_price
+                v[8] = rolling_margin
+                v[9] = shortrun_price_effect_on_demand
+                v[10] = underlying_freight_activity
+                v[11] = actual_freight_price
+                v[12] = ci_adjustment
+                v[13] = cost_pressure_on_efficiency
+                v[14] = degradation
+                v[15] = efficiency_target
+                v[16] = emissions
+                v[17] = extra_fuel_cost_per_km
+                v[18] = freight_activity
+                v[19] = freight_demand
+                v[20] = fuel_consumption
+                v[21] = fuel_cost_per_km
+                v[22] = improvement
+                v[23] = margin
+                v[24] = operating_cost_per_km
+                v[25] = operating_expenses
+                v[26] = profit
+                v[27] = revenue
+                v[28] = viability_flag
+                for m in range(columns.shape[0]):
+                    out[r, i // save_every, m] = v[columns[m]]
+            if i == n_steps:
+                break
+            d_average_fuel_efficiency = (improvement - degradation)
+            d_carbon_intensity_of_fuel = ci_adjustment
+            d_cumulative_co2 = emissions
+            d_cumulative_profit = profit
+            d_duration_below_margin_threshold = (1.0 if (rolling_margin < margin_threshold) else 0.0)
+            d_effective_passthrough_share = ((desired_passthrough_share - effective_passthrough_share) / tau_p)
+            _cse0 = (perceived_freight_price / baseline_freight_price)
+            d_longrun_price_effect_on_demand = ((((underlying_freight_activity * (_cse0 ** elasticity_lr)) - underlying_freight_activity) - longrun_price_effect_on_demand) / tau_lr)
+            d_perceived_freight_price = ((actual_freight_price - perceived_freight_price) / tau_p)
+            d_rolling_margin = ((margin - rolling_margin) / tau_m)
+            d_shortrun_price_effect_on_demand = ((((underlying_freight_activity * (_cse0 ** elasticity_sr)) - underlying_freight_activity) - shortrun_price_effect_on_demand) / tau_sr)
+            d_underlying_freight_activity = (freight_activity_growth_rate * underlying_freight_activity)
+            average_fuel_efficiency = average_fuel_efficiency + d_average_fuel_efficiency * dt
+            carbon_intensity_of_fuel = carbon_intensity_of_fuel + d_carbon_intensity_of_fuel * dt
+            cumulative_co2 = cumulative_co2 + d_cumulative_co2 * dt
+            cumulative_profit = cumulative_profit + d_cumulative_profit * dt
+            duration_below_margin_threshold = duration_below_margin_threshold + d_duration_below_margin_threshold * dt
+            effective_passthrough_share = effective_passthrough_share + d_effective_passthrough_share * dt
+            longrun_price_effect_on_demand = longrun_price_effect_on_demand + d_longrun_price_effect_on_demand * dt
+            perceived_freight_price = perceived_freight_price + d_perceived_freight_price * dt
+            rolling_margin = rolling_margin + d_rolling_margin * dt
+            shortrun_price_effect_on_demand = shortrun_price_effect_on_demand + d_shortrun_price_effect_on_demand * dt
+            underlying_freight_activity = underlying_freight_activity + d_underlying_freight_activity * dt
@@ -1,10 +1,14 @@
 import pysd
 import os
 import shutil
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SRC_DIR = os.path.dirname(os.path.abspath(__file__))
 
+sys.path.insert(0, BASE_DIR)
+from src.utils.codegen import check_kernel, write_kernel
+
 # Path to the .mdl file
 mdl_file = os.path.join(BASE_DIR, 'vensim', 'model.mdl')
 
@@ -17,3 +21,13 @@ if os.path.exists(generated_py_file):
     shutil.move(generated_py_file, target_py_file)
 else:
     raise FileNotFoundError(f"Generated file {generated_py_file} not found")
+
+# Batched NumPy kernel of the same equations
+write_kernel(mdl_file, os.path.join(SRC_DIR, 'model_kernel.py'))
+
+# Both translations must give the same results
+mismatches = check_kernel(model)
+if mismatches:
+    raise RuntimeError(
+        "The generated kernel disagrees with the PySD model: " + ", ".join(mismatches)
+    )
@@ -0,0 +1,295 @@
+"""
+Vectorized batch simulation of the freight carbon-tax model.
+
+This module evaluates the equations of vensim/model.mdl on NumPy arrays so
+that many parameter sets (scenarios) are advanced through the same Euler step
+at once, instead of calling the PySD `model.run` once per parameter set. The
+equations and the lists of variables come from the kernel that
+src/utils/codegen.py generates from the .mdl (src/model_kernel.py), which is
+regenerated whenever the .mdl changes, so every engine built on this module
+follows the model.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+from src.utils.codegen import load_kernel
+
+_kernel = load_kernel()
+
+# Integ and Smooth stocks of the model
+STOCKS = list(_kernel.STOCKS)
+
+# Constants that can be overridden through params (see params.yaml)
+CONSTANTS = sorted(_kernel.CONSTANTS)
+
+# Auxiliaries that only depend on constants
+RUN_CONSTANTS = list(_kernel.RUN_CONSTANTS)
+
+# Auxiliaries that change at every time step
+AUXILIARIES = list(_kernel.AUXILIARIES)
+
+VARIABLES = CONSTANTS + RUN_CONSTANTS + STOCKS + AUXILIARIES
+
+
+class Snapshot(NamedTuple):
+    """
+    Model state at a point in time: the time and the value of every stock,
+    as scalars or arrays of shape (n_scenarios,).
+
+    A snapshot has the (time, dict) form of PySD initial conditions, so a
+    single-scenario snapshot can be passed directly as
+    `model.run(initial_condition=snapshot)`, and any snapshot as the
+    initial_condition of run_batch to fork many continuations from it.
+    """
+    time: float
+    stocks: Dict
+
+    def scenario(self, i: int) -> "Snapshot":
+        """
+        Single-scenario snapshot of scenario i, with scalar stock values.
+        """
+        return Snapshot(
+            self.time, {name: float(np.ravel(value)[i]) for name, value in self.stocks.items()}
+        )
+
+
+def snapshot(model) -> Snapshot:
+    """
+    Capture the current state of a PySD model (e.g. while stepping).
+    """
+    return Snapshot(
+        model.time(), {name: getattr(model.components, name)() for name in STOCKS}
+    )
+
+
+def _check_constants(names):
+    unknown = set(names) - set(CONSTANTS)
+    if unknown:
+        raise NameError(
+            f"{sorted(unknown)} are not constants of the model and cannot be "
+            "set in a batch run."
+        )
+
+
+def batch_params(model, params) -> Dict[str, np.ndarray]:
+    """
+    Stack parameter sets into one array of shape (n_scenarios,) per constant.
+
+    `params` is either a list of parameter dicts (one per scenario), a dict
+    mapping names to scalars or 1-D arrays (scalars are broadcast), or a
+    DataFrame with one row per scenario. Constants missing from `params`
+    take their current value in the loaded PySD model.
+    """
+    if isinstance(params, pd.DataFrame):
+        params = {name: params[name].to_numpy() for name in params.columns}
+    elif isinstance(params, (list, tuple)):
+        if not params:
+            raise ValueError("At least one parameter set is required.")
+        names = set().union(*params)
+        _check_constants(names)
+        params = {
+            name: np.array([
+                p[name] if name in p else getattr(model.components, name)()
+                for p in params
+            ], dtype=float)
+            for name in names
+        }
+    _check_constants(params)
+
+    sizes = {np.size(value) for value in params.values() if np.ndim(value) > 0}
+    if len(sizes) > 1:
+        raise ValueError(f"Parameter arrays have different lengths: {sorted(sizes)}")
+    n = sizes.pop() if sizes else 1
+
+    constants = {}
+    for name in CONSTANTS:
+        value = params[name] if name in params else getattr(model.components, name)()
+        constants[name] = np.broadcast_to(np.asarray(value, dtype=float), (n,)).copy()
+    return constants
+
+
+def fold_constants(c: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Evaluate the auxiliaries that depend only on constants, once per batch.
+    """
+    return _kernel.fold_constants(c)
+
+
+def fold_tax(c: Dict[str, np.ndarray]) -> None:
+    """
+    (Re)evaluate the run constants after the carbon tax rate (or another
+    constant) changed, in place.
+    """
+    c.update(_kernel.fold_constants(c))
+
+
+def initial_state(c: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Initialize the stocks in the same order PySD does.
+    """
+    zeros = np.zeros(np.size(c["carbon_tax_rate"]))
+    # Adding zeros gives every stock its own array of shape (n_scenarios,)
+    return {name: zeros + value for name, value in _kernel.initial_stocks(c).items()}
+
+
+def auxiliaries(c: Dict[str, np.ndarray], s: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Evaluate every time-varying auxiliary for the current stocks.
+    """
+    return _kernel.auxiliaries(c, s)
+
+
+def derivatives(
+    c: Dict[str, np.ndarray], s: Dict[str, np.ndarray], a: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """
+    Net flow of every stock for the current stocks and auxiliaries.
+    """
+    return _kernel.derivatives(c, s, a)
+
+
+def euler_step(c, s, a, dt) -> Dict[str, np.ndarray]:
+    """
+    Advance all stocks by one Euler step of length dt.
+    """
+    d = derivatives(c, s, a)
+    return {name: s[name] + d[name] * dt for name in STOCKS}
+
+
+def lookup(name: str, c, s, a) -> np.ndarray:
+    """
+    Value of a model variable from the constants, stocks or auxiliaries.
+    """
+    for values in (s, a, c):
+        if name in values:
+            return values[name]
+    raise KeyError(name)
+
+
+def _initial_stocks(c, initial_condition):
+    if initial_condition is None:
+        return 0, initial_state(c)
+    n = np.size(c["carbon_tax_rate"])
+    missing = set(STOCKS) - set(initial_condition.stocks)
+    if missing:
+        raise ValueError(f"The initial condition lacks the stocks {sorted(missing)}")
+    return initial_condition.time, {
+        name: np.broadcast_to(
+            np.asarray(initial_condition.stocks[name], dtype=float), (n,)
+        ).copy()
+        for name in STOCKS
+    }
+
+
+def simulate(c: Dict[str, np.ndarray], final_time: float, time_step: float,
+             observe: Callable, initial_condition: Optional[Snapshot] = None
+             ) -> Dict[str, np.ndarray]:
+    """
+    Euler loop over folded constants `c`, calling observe(i, c, s, a) with the
+    step index, stocks and auxiliaries at every time step including the
+    initial one. Starts from the model's initial stocks at time 0, or from
+    initial_condition (whose stocks broadcast over the scenarios). Returns
+    the stocks at final_time.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        initial_time, s = _initial_stocks(c, initial_condition)
+        n_steps = int(round((final_time - initial_time) / time_step))
+        for i in range(n_steps + 1):
+            a = auxiliaries(c, s)
+            observe(i, c, s, a)
+            if i < n_steps:
+                s = euler_step(c, s, a, time_step)
+    return s
+
+
+def _check_columns(return_columns):
+    unknown = [name for name in return_columns if name not in VARIABLES]
+    if unknown:
+        raise NameError(f"{unknown} are not variables of the batch model.")
+
+
+def run_batch(
+    model,
+    params: Union[Dict, List[Dict], pd.DataFrame],
+    return_columns: Optional[List[str]] = None,
+    final_time: int = 120,
+    time_step: float = 1,
+    saveper: Optional[float] = None,
+    initial_condition: Optional[Snapshot] = None,
+) -> pd.DataFrame:
+    """
+    Simulate many parameter sets at once with Euler integration.
+
+    Parameters:
+    -----------
+    model : PySD model
+        The loaded PySD model. Only used for the values of constants that
+        are not given in `params`.
+    params : dict, list of dict or DataFrame
+        Parameter sets to simulate, see `batch_params`.
+    return_columns : list, optional
+        Python names of the variables to return. Defaults to cumulative metrics.
+    final_time : int
+        Simulation length in months (default: 120)
+    time_step : float
+        Euler time step in months (default: 1)
+    saveper : float, optional
+        Output frequency in months. Defaults to time_step.
+    initial_condition : Snapshot, optional
+        State to start from instead of the initial stocks at time 0. A
+        single-scenario snapshot is shared by all parameter sets, which
+        forks one continuation per parameter set.
+
+    Returns:
+    --------
+    DataFrame indexed by time with (variable, scenario) columns, so that
+    `result["cumulative_co2"]` has one column per scenario in input order.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+    _check_columns(return_columns)
+
+    if saveper is None:
+        saveper = time_step
+    save_every = max(int(round(saveper / time_step)), 1)
+
+    c = fold_constants(batch_params(model, params))
+    n = np.size(c["carbon_tax_rate"])
+
+    initial_time = initial_condition.time if initial_condition is not None else 0
+    times = []
+    records = {name: [] for name in return_columns}
+
+    def record(i, c, s, a):
+        if i % save_every == 0:
+            times.append(initial_time + i * time_step)
+            for name in return_columns:
+                records[name].append(np.broadcast_to(lookup(name, c, s, a), (n,)))
+
+    simulate(c, final_time, time_step, record, initial_condition)
+
+    data = np.concatenate(
+        [np.stack(records[name]) for name in return_columns], axis=1
+    ) if return_columns else np.empty((len(times), 0))
+    columns = pd.MultiIndex.from_product(
+        [return_columns, range(n)], names=["variable", "scenario"]
+    )
+    return pd.DataFrame(data, index=pd.Index(times, name="time"), columns=columns)
+
+
+def run_to(model, params: Union[Dict, List[Dict], pd.DataFrame], time: float,
+           time_step: float = 1, initial_condition: Optional[Snapshot] = None
+           ) -> Snapshot:
+    """
+    Simulate parameter sets up to `time` and return the state reached, e.g.
+    to simulate a shared prefix once and fork the continuations from it.
+    """
+    c = fold_constants(batch_params(model, params))
+    stocks = simulate(c, time, time_step, lambda *args: None, initial_condition)
+    return Snapshot(time, stocks)
@@ -0,0 +1,238 @@
+"""
+Content-addressed on-disk cache for model results.
+
+Entries are keyed on a hash of the model files (vensim/model.mdl and
+src/model.py), the full set of effective model constants, the return
+columns and the time settings, so editing the model invalidates them
+automatically. Results are stored as compressed NumPy archives and the
+least recently used entries are evicted once the cache exceeds its size cap.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from src.utils.batch import CONSTANTS
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+MODEL_FILES = [BASE_DIR / "vensim" / "model.mdl", BASE_DIR / "src" / "model.py"]
+
+
+def _normalize(value):
+    """
+    Convert parameter values to a canonical JSON-serializable form.
+    """
+    if isinstance(value, pd.Series):
+        return {
+            "index": [_normalize(v) for v in value.index],
+            "values": [_normalize(v) for v in value.values],
+        }
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    return str(value)
+
+
+def file_digest(files) -> str:
+    """
+    SHA-256 of the concatenated contents of files (missing files count as empty).
+    """
+    digest = hashlib.sha256()
+    for f in files:
+        f = Path(f)
+        digest.update(f.read_bytes() if f.exists() else b"")
+    return digest.hexdigest()
+
+
+class RunCache:
+    """
+    Persistent cache for `model.run` results and derived quantities.
+
+    Parameters:
+    -----------
+    directory : str or Path, optional
+        Where entries are stored. Defaults to .cache/runs in the repository.
+    max_bytes : int
+        Size cap of the cache directory. Least recently used entries are
+        evicted when it is exceeded (default: 256 MiB).
+    model_files : list, optional
+        Files whose contents are part of every key. Defaults to
+        vensim/model.mdl and src/model.py.
+    """
+
+    def __init__(self, directory=None, max_bytes: int = 256 * 2**20,
+                 model_files: Optional[List] = None):
+        self.directory = Path(directory) if directory else BASE_DIR / ".cache" / "runs"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.model_files = [Path(f) for f in (model_files or MODEL_FILES)]
+        self._digest = None
+        self._digest_stamp = None
+        self.hits = 0
+        self.misses = 0
+
+    def model_digest(self) -> str:
+        """
+        Hash of the model files, recomputed only when they change on disk.
+        """
+        stamp = tuple(
+            (f.stat().st_mtime_ns, f.stat().st_size) if f.exists() else None
+            for f in self.model_files
+        )
+        if stamp != self._digest_stamp:
+            self._digest = file_digest(self.model_files)
+            self._digest_stamp = stamp
+        return self._digest
+
+    def key(self, kind: str, model, params: Optional[Dict] = None,
+            **settings) -> str:
+        """
+        Content address of a result: the model digest, the effective value of
+        every model constant (params override the values currently set in
+        the model) and any further settings such as return columns.
+        """
+        params = params or {}
+        constants = {
+            name: params[name] if name in params else getattr(model.components, name)()
+            for name in CONSTANTS
+        }
+        constants.update(params)
+        payload = json.dumps(
+            {
+                "kind": kind,
+                "model": self.model_digest(),
+                "params": _normalize(constants),
+                "settings": _normalize(settings),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.npz"
+
+    def get(self, key: str):
+        """
+        Cached value for key, or None. Hits refresh the entry's LRU position.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if "columns" in data:
+                    value = pd.DataFrame(
+                        data["values"],
+                        index=pd.Index(data["index"], name="time"),
+                        columns=[str(c) for c in data["columns"]],
+                    )
+                    if "meta" in data:
+                        meta = json.loads(data["meta"].item())
+                        value.index = value.index.astype(meta["index_dtype"])
+                        value.index.name = meta["index_name"]
+                        value = value.astype(dict(zip(value.columns, meta["dtypes"])))
+                else:
+                    value = data["values"].item()
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        Store a DataFrame or a scalar under key and enforce the size cap.
+        """
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        if isinstance(value, pd.DataFrame):
+            np.savez_compressed(
+                tmp_path,
+                values=value.to_numpy(dtype=float),
+                index=value.index.to_numpy(dtype=float),
+                columns=np.array([str(c) for c in value.columns]),
+                # Restored by get, so that hits return the frame of a miss
+                meta=np.array(json.dumps({
+                    "dtypes": [str(dtype) for dtype in value.dtypes],
+                    "index_dtype": str(value.index.dtype),
+                    "index_name": value.index.name,
+                })),
+            )
+        else:
+            np.savez_compressed(tmp_path, values=np.array(value))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+        """
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        for path in self.directory.glob("*.npz"):
+            path.unlink(missing_ok=True)
+
+    def run(self, model, params: Optional[Dict] = None,
+            return_columns: Optional[List[str]] = None,
+            final_time: Optional[float] = None,
+            time_step: Optional[float] = None,
+            saveper: Optional[float] = None) -> pd.DataFrame:
+        """
+        Cached equivalent of model.run(params=..., return_columns=...).
+        """
+        settings = {
+            "return_columns": list(return_columns) if return_columns is not None else None,
+            "initial_time": model.time.initial_time(),
+            "final_time": final_time if final_time is not None else model.time.final_time(),
+            "time_step": time_step if time_step is not None else model.time.time_step(),
+            "saveper": saveper if saveper is not None else model.time.saveper(),
+        }
+        key = self.key("run", model, params, **settings)
+        result = self.get(key)
+        if result is None:
+            result = model.run(
+                params=params,
+                return_columns=return_columns,
+                final_time=final_time,
+                time_step=time_step,
+                saveper=saveper,
+            )
+            self.put(key, result)
+        return result
+
+    def call(self, func: Callable, model, params: Dict, **kwargs):
+        """
+        Cached func(model, params, **kwargs) for analysis functions that
+        return a scalar or a DataFrame, e.g. calculate_max_viable_tax.
+        """
+        name = f"{func.__module__}.{func.__qualname__}"
+        key = self.key(name, model, params, **kwargs)
+        result = self.get(key)
+        if result is None:
+            result = func(model, params, **kwargs)
+            self.put(key, result)
+        return result
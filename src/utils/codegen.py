@@ -0,0 +1,609 @@
+"""
+Generate a batched NumPy kernel from vensim/model.mdl.
+
+The equations are read from the same PySD abstract model that
+pysd.read_vensim translates into src/model.py, and emitted as a Python
+module of array-valued functions: fold_constants (auxiliaries that only
+depend on constants), initial_stocks, and topologically ordered auxiliaries
+and derivatives functions in which repeated subexpressions are computed
+once, plus run_scenarios, the scalar loop compiled by src/utils/jit.py. The
+module records the hash of the .mdl it was generated from, and load_kernel
+regenerates it whenever the .mdl changes. src/utils/batch.py evaluates the
+model through these functions, so the array engines follow the .mdl.
+"""
+
+import hashlib
+import importlib.util
+import os
+import sys
+import numpy as np
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+MDL_FILE = BASE_DIR / "vensim" / "model.mdl"
+KERNEL_FILE = BASE_DIR / "src" / "model_kernel.py"
+
+# Version of the generated code, to be increased whenever its layout or
+# equations change
+KERNEL_FORMAT = 2
+
+CONTROL_VARIABLES = ["initial_time", "final_time", "time_step", "saveper"]
+
+FUNCTIONS = {
+    "abs": "np.abs",
+    "exp": "np.exp",
+    "if_then_else": "np.where",
+    "integer": "np.trunc",
+    "ln": "np.log",
+    "max": "np.maximum",
+    "min": "np.minimum",
+    "power": "np.power",
+    "sqrt": "np.sqrt",
+}
+
+# Scalar counterparts used in the per-scenario loop, where NumPy calls on
+# Python floats would dominate the cost of the step
+SCALAR_FUNCTIONS = {
+    "abs": "abs({0})",
+    "exp": "math.exp({0})",
+    "if_then_else": "({1} if {0} else {2})",
+    "integer": "float(math.trunc({0}))",
+    "ln": "math.log({0})",
+    "max": "max({0}, {1})",
+    "min": "min({0}, {1})",
+    "power": "({0} ** {1})",
+    "sqrt": "math.sqrt({0})",
+}
+
+OPERATORS = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+    "/": "/",
+    "^": "**",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "=": "==",
+    "<>": "!=",
+    ":and:": "&",
+    ":or:": "|",
+}
+
+
+class Expr:
+    """
+    Expression tree node. `template` is a format string over the rendered
+    children, and `scalar_template` its variant for Python floats; leaves
+    are numbers and references to model variables.
+    """
+
+    def __init__(self, template: str, children=(), value=None, reference=None,
+                 scalar_template=None):
+        self.template = template
+        self.scalar_template = scalar_template or template
+        self.children = tuple(children)
+        self.value = value
+        self.reference = reference
+        self.key = template.format(*(child.key for child in self.children))
+
+    @classmethod
+    def number(cls, value):
+        return cls(repr(float(value)), value=float(value))
+
+    @classmethod
+    def ref(cls, name):
+        return cls(name, reference=name)
+
+    @property
+    def compound(self) -> bool:
+        return bool(self.children)
+
+    def references(self) -> set:
+        if self.reference is not None:
+            return {self.reference}
+        return set().union(*(child.references() for child in self.children))
+
+    def render(self, names: Dict[str, str], scalar: bool = False) -> str:
+        """
+        Code of the expression, using names[key] for hoisted subexpressions
+        and for references.
+        """
+        if self.key in names:
+            return names[self.key]
+        template = self.scalar_template if scalar else self.template
+        return template.format(*(child.render(names, scalar) for child in self.children))
+
+
+def _operation(template, children, scalar_template=None):
+    expr = Expr(template, children, scalar_template=scalar_template)
+    if all(child.value is not None for child in children):
+        # Fold expressions of literals, e.g. 19 * power(10, 9)
+        return Expr.number(eval(expr.key, {"np": np}))
+    return expr
+
+
+def _convert(ast, names: Dict[str, str]) -> Expr:
+    """
+    Convert a PySD abstract syntax tree to an Expr.
+    """
+    from pysd.translators.structures import abstract_expressions as ae
+
+    if isinstance(ast, (int, float)):
+        return Expr.number(ast)
+    if isinstance(ast, ae.ReferenceStructure):
+        if ast.subscripts is not None:
+            raise NotImplementedError("Subscripted variables are not supported.")
+        return Expr.ref(names[ast.reference.lower()])
+    if isinstance(ast, (ae.ArithmeticStructure, ae.LogicStructure)):
+        arguments = [_convert(argument, names) for argument in ast.arguments]
+        operators = [op.lower() for op in ast.operators]
+        if operators in (["negative"], [":not:"]):
+            if operators == ["negative"]:
+                return _operation("(-{0})", arguments)
+            return _operation("(~{0})", arguments, "(not {0})")
+        template = "({0}"
+        for i, op in enumerate(operators, start=1):
+            if op not in OPERATORS:
+                raise NotImplementedError(f"Unsupported operator {op!r}.")
+            template += f" {OPERATORS[op]} {{{i}}}"
+        return _operation(template + ")", arguments)
+    if isinstance(ast, ae.CallStructure):
+        function = ast.function.reference.lower()
+        if function not in FUNCTIONS:
+            raise NotImplementedError(f"Unsupported function {function!r}.")
+        arguments = [_convert(argument, names) for argument in ast.arguments]
+        template = FUNCTIONS[function] + "(" + ", ".join(
+            f"{{{i}}}" for i in range(len(arguments))
+        ) + ")"
+        return _operation(template, arguments, SCALAR_FUNCTIONS[function])
+    raise NotImplementedError(f"Unsupported expression {type(ast).__name__}.")
+
+
+def parse_model(mdl_file=MDL_FILE) -> Dict:
+    """
+    Equations of the model as Expr trees, split into constants (with their
+    values), stocks (flow and initial value) and auxiliaries, and the values
+    of the time settings.
+    """
+    from pysd.builders.python.namespace import NamespaceManager
+    from pysd.translators.structures import abstract_expressions as ae
+    from pysd.translators.vensim.vensim_file import VensimFile
+
+    vensim_file = VensimFile(str(mdl_file))
+    vensim_file.parse()
+    section = vensim_file.get_abstract_model().sections[0]
+
+    # Same Python names as the PySD builder gives in src/model.py
+    namespace = NamespaceManager()
+    for element in section.elements:
+        namespace.add_to_namespace(element.name)
+    names = dict(namespace.cleanspace)
+
+    constants, stocks, auxiliaries, control = {}, {}, {}, {}
+    for element in section.elements:
+        name = names[element.name.lower().replace(" ", "_")]
+        if len(element.components) != 1:
+            raise NotImplementedError(f"{name} has several equations.")
+        ast = element.components[0].ast
+        if name in CONTROL_VARIABLES:
+            control[name] = _convert(ast, names)
+        elif isinstance(ast, ae.IntegStructure):
+            stocks[name] = (_convert(ast.flow, names), _convert(ast.initial, names))
+        elif isinstance(ast, ae.SmoothStructure):
+            if ast.order != 1:
+                raise NotImplementedError(f"{name} is a smooth of order {ast.order}.")
+            flow = _operation(
+                "(({0} - {1}) / {2})",
+                [_convert(ast.input, names), Expr.ref(name),
+                 _convert(ast.smooth_time, names)],
+            )
+            stocks[name] = (flow, _convert(ast.initial, names))
+        else:
+            expr = _convert(ast, names)
+            if expr.value is not None:
+                constants[name] = expr.value
+            else:
+                auxiliaries[name] = expr
+    # SAVEPER often refers to TIME STEP
+    for name, expr in control.items():
+        if expr.reference is not None:
+            expr = control[expr.reference]
+        if expr.value is None:
+            raise NotImplementedError(f"{name} is not a number.")
+        control[name] = expr.value
+    return {
+        "constants": constants,
+        "stocks": stocks,
+        "auxiliaries": auxiliaries,
+        "control": {name: control[name] for name in CONTROL_VARIABLES},
+    }
+
+
+def _topological(equations: Dict[str, Expr], available: set) -> List[str]:
+    """
+    Order equations so that every one comes after the equations it uses.
+    """
+    order, done = [], set(available)
+    remaining = dict(equations)
+    while remaining:
+        ready = sorted(
+            name for name, expr in remaining.items()
+            if expr.references() - {name} <= done
+        )
+        if not ready:
+            raise ValueError(f"Circular or undefined references in {sorted(remaining)}")
+        for name in ready:
+            order.append(name)
+            done.add(name)
+            del remaining[name]
+    return order
+
+
+def _count(exprs, counts):
+    """
+    Count the occurrences of compound subexpressions, descending only into
+    their first occurrence so that parts of a repeated subexpression are
+    not counted again.
+    """
+    for expr in exprs:
+        if not expr.compound:
+            continue
+        counts[expr.key] = counts.get(expr.key, 0) + 1
+        if counts[expr.key] == 1:
+            _count(expr.children, counts)
+
+
+class _Emitter:
+    """
+    Emit assignments in order, hoisting repeated subexpressions into
+    temporaries right before their first use.
+    """
+
+    def __init__(self, counts, scalar=False, indent=4):
+        self.counts = counts
+        self.scalar = scalar
+        self.indent = " " * indent
+        self.names = {}
+        self.lines = []
+
+    def _hoist(self, expr):
+        for child in expr.children:
+            self._hoist(child)
+        if expr.compound and self.counts.get(expr.key, 0) > 1 and expr.key not in self.names:
+            temp = f"_cse{sum(name.startswith('_cse') for name in self.names.values())}"
+            self.lines.append(f"{self.indent}{temp} = {expr.render(self.names, self.scalar)}")
+            self.names[expr.key] = temp
+
+    def assign(self, target, expr, name=None):
+        for child in expr.children:
+            self._hoist(child)
+        self.lines.append(f"{self.indent}{target} = {expr.render(self.names, self.scalar)}")
+        if name is not None and expr.compound:
+            # Later occurrences of the whole expression reuse the variable
+            self.names.setdefault(expr.key, name)
+
+
+def _digest(mdl_file) -> str:
+    # Hash of the .mdl and of the kernel format, so that kernels written by
+    # an earlier version of the generator count as out of date too
+    digest = hashlib.sha256(Path(mdl_file).read_bytes())
+    digest.update(f"kernel format {KERNEL_FORMAT}".encode())
+    return digest.hexdigest()
+
+
+def generate_kernel(mdl_file=MDL_FILE) -> str:
+    """
+    Source code of the kernel module for mdl_file.
+    """
+    model = parse_model(mdl_file)
+    constants = model["constants"]
+    stocks = model["stocks"]
+    auxiliaries = model["auxiliaries"]
+    digest = _digest(mdl_file)
+
+    # Auxiliaries that only depend on constants are folded once per run
+    run_constants = {}
+    for name in _topological(auxiliaries, set(constants) | set(stocks) | {"time"}):
+        if auxiliaries[name].references() <= set(constants) | set(run_constants):
+            run_constants[name] = auxiliaries[name]
+    step_auxiliaries = {
+        name: expr for name, expr in auxiliaries.items() if name not in run_constants
+    }
+    folded = set(constants) | set(run_constants)
+
+    def header(used, source="k"):
+        return [f"    {name} = {source}[{name!r}]" for name in sorted(used)]
+
+    lines = [
+        '"""',
+        f"Batched NumPy kernel generated from {Path(mdl_file).name} by",
+        "src/utils/codegen.py. Do not edit: it is regenerated whenever the .mdl",
+        "changes.",
+        "",
+        "Every value is a scalar or an array of shape (n_scenarios,), except",
+        "in run_scenarios, which loops over scenarios on Python floats.",
+        '"""',
+        "",
+        "import math",
+        "import numpy as np",
+        "",
+        "# Replaced by numba.prange when run_scenarios is compiled",
+        "prange = range",
+        "",
+        f"MDL_DIGEST = {digest!r}",
+        "",
+        "CONTROL = {",
+        *[f"    {name!r}: {value!r}," for name, value in model["control"].items()],
+        "}",
+        "",
+        "CONSTANTS = {",
+        *[f"    {name!r}: {value!r}," for name, value in sorted(constants.items())],
+        "}",
+        "",
+        f"RUN_CONSTANTS = {list(run_constants)!r}",
+        "",
+        f"STOCKS = {sorted(stocks)!r}",
+        "",
+        f"AUXILIARIES = {sorted(step_auxiliaries)!r}",
+        "",
+        "# Columns of the constants and outputs of run_scenarios",
+        f"FOLDED = {[*sorted(constants), *run_constants]!r}",
+        "",
+        "VARIABLES = STOCKS + AUXILIARIES",
+        "",
+    ]
+
+    # fold_constants
+    emitter = _Emitter({})
+    for name, expr in run_constants.items():
+        emitter.assign(name, expr, name)
+    used = set().union(*(e.references() for e in run_constants.values())) - set(run_constants)
+    lines += [
+        "",
+        "def fold_constants(k):",
+        '    """',
+        "    Constants extended with the auxiliaries that only depend on them.",
+        '    """',
+        "    k = dict(k)",
+        *header(used),
+        *emitter.lines,
+        *[f"    k[{name!r}] = {name}" for name in run_constants],
+        "    return k",
+        "",
+    ]
+
+    # initial_stocks: stocks are initialized in dependency order, with any
+    # auxiliaries their initial values need
+    initial = {name: initial for name, (_, initial) in stocks.items()}
+    needed, frontier = {}, set().union(*(e.references() for e in initial.values()))
+    while frontier:
+        name = frontier.pop()
+        if name in step_auxiliaries and name not in needed:
+            needed[name] = step_auxiliaries[name]
+            frontier |= needed[name].references()
+    initial_order = _topological({**initial, **needed}, folded | {"time"})
+    emitter = _Emitter({})
+    for name in initial_order:
+        emitter.assign(name, initial.get(name, needed.get(name)))
+    used = set().union(*(e.references() for e in [*initial.values(), *needed.values()])) & folded
+    lines += [
+        "",
+        "def initial_stocks(k, time=0):",
+        '    """',
+        "    Initial value of every stock, for folded constants k.",
+        '    """',
+        *header(used),
+        *emitter.lines,
+        "    return {",
+        *[f"        {name!r}: {name}," for name in sorted(stocks)],
+        "    }",
+        "",
+    ]
+
+    # auxiliaries and derivatives, the equations of one time step
+    flows = {name: flow for name, (flow, _) in stocks.items()}
+    step_order = _topological(step_auxiliaries, folded | set(stocks) | {"time"})
+    counts = {}
+    _count(step_auxiliaries.values(), counts)
+    emitter = _Emitter(counts)
+    for name in step_order:
+        emitter.assign(name, step_auxiliaries[name], name)
+    used = set().union(*(e.references() for e in step_auxiliaries.values()))
+    lines += [
+        "",
+        "def auxiliaries(k, s, time=0):",
+        '    """',
+        "    Every auxiliary that changes over time, at the stocks s.",
+        '    """',
+        *header(used & folded),
+        *header(used & set(stocks), "s"),
+        *emitter.lines,
+        "    return {",
+        *[f"        {name!r}: {name}," for name in sorted(step_auxiliaries)],
+        "    }",
+        "",
+    ]
+    counts = {}
+    _count(flows.values(), counts)
+    emitter = _Emitter(counts)
+    for name in sorted(flows):
+        emitter.assign(f"d_{name}", flows[name])
+    used = set().union(*(e.references() for e in flows.values()))
+    lines += [
+        "",
+        "def derivatives(k, s, a, time=0):",
+        '    """',
+        "    Net flow of every stock, at the stocks s and auxiliaries a.",
+        '    """',
+        *header(used & folded),
+        *header(used & set(stocks), "s"),
+        *header(used & set(step_auxiliaries), "a"),
+        *emitter.lines,
+        "    return {",
+        *[f"        {name!r}: d_{name}," for name in sorted(stocks)],
+        "    }",
+        "",
+    ]
+
+    # run_scenarios: the whole Euler loop of every scenario on scalars, with
+    # the flows only evaluated when there is a next step
+    counts = {}
+    _count([*step_auxiliaries.values(), *flows.values()], counts)
+    folded_order = [*sorted(constants), *run_constants]
+    variables = [*sorted(stocks), *sorted(step_auxiliaries)]
+    start = _Emitter({}, scalar=True, indent=12)
+    for name in initial_order:
+        start.assign(name, initial.get(name, needed.get(name)))
+    emitter = _Emitter(counts, scalar=True, indent=12)
+    for name in step_order:
+        emitter.assign(name, step_auxiliaries[name], name)
+    n_auxiliary_lines = len(emitter.lines)
+    for name in sorted(flows):
+        emitter.assign(f"d_{name}", flows[name])
+    used = set().union(*(
+        e.references()
+        for e in [*initial.values(), *needed.values(), *step_auxiliaries.values(),
+                  *flows.values()]
+    )) & folded
+    lines += [
+        "",
+        "def run_scenarios(K, S0, initialize, t0, n_steps, dt, save_every, columns, out):",
+        '    """',
+        "    Euler loop of each scenario. Row r of K holds its folded constants",
+        "    (FOLDED order) and row r of S0 its stocks at t0 (STOCKS order),",
+        "    which are computed instead if initialize is true. Variable",
+        "    VARIABLES[columns[m]] at the j-th saved step is written to",
+        "    out[r, j, m].",
+        '    """',
+        "    for r in prange(K.shape[0]):",
+        f"        v = np.empty({len(variables)})",
+        *[f"        {name} = K[r, {folded_order.index(name)}]" for name in sorted(used)],
+        "        time = t0",
+        "        if initialize:",
+        *start.lines,
+        "        else:",
+        *[f"            {name} = S0[r, {i}]" for i, name in enumerate(sorted(stocks))],
+        "        for i in range(n_steps + 1):",
+        "            time = t0 + i * dt",
+        *emitter.lines[:n_auxiliary_lines],
+        "            if i % save_every == 0:",
+        *[f"                v[{i}] = {name}" for i, name in enumerate(variables)],
+        "                for m in range(columns.shape[0]):",
+        "                    out[r, i // save_every, m] = v[columns[m]]",
+        "            if i == n_steps:",
+        "                break",
+        *emitter.lines[n_auxiliary_lines:],
+        *[f"            {name} = {name} + d_{name} * dt" for name in sorted(stocks)],
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def write_kernel(mdl_file=MDL_FILE, kernel_file=KERNEL_FILE) -> None:
+    """
+    Generate the kernel for mdl_file and atomically write it to kernel_file.
+    """
+    kernel_file = Path(kernel_file)
+    tmp_file = kernel_file.with_name(f".{kernel_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(generate_kernel(mdl_file))
+    os.replace(tmp_file, kernel_file)
+
+
+def _import(kernel_file):
+    spec = importlib.util.spec_from_file_location("model_kernel", kernel_file)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so that Numba's on-disk cache can find it in later processes
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_kernel(mdl_file=MDL_FILE, kernel_file=KERNEL_FILE):
+    """
+    Import the kernel module. Only src/translate_model.py (or an explicit
+    write_kernel call) writes it: a kernel that is missing or was generated
+    from a different version of mdl_file or in an earlier KERNEL_FORMAT
+    raises a RuntimeError.
+    """
+    kernel = _import(kernel_file) if Path(kernel_file).exists() else None
+    if kernel is None or getattr(kernel, "MDL_DIGEST", None) != _digest(mdl_file):
+        raise RuntimeError(
+            f"{kernel_file} is missing or out of date with {mdl_file}; "
+            "re-run src/translate_model.py."
+        )
+    return kernel
+
+
+# Tax levels at which check_kernel compares the kernel with PySD
+CHECK_TAXES = [0, 289, 5000, 20000]
+
+
+def check_kernel(model, taxes=CHECK_TAXES, rtol: float = 1e-9) -> List[str]:
+    """
+    Compare batch.run_batch, which evaluates the generated kernel, with
+    model.run of the translated PySD model for every variable at each tax
+    level, over the model's time settings.
+
+    Returns "<variable> at tax <tax>" for every variable whose values differ
+    by more than rtol times its largest magnitude in the run, so an empty
+    list means the kernel reproduces PySD.
+    """
+    from src.utils.batch import VARIABLES, run_batch
+
+    final_time = model.time.final_time()
+    time_step = model.time.time_step()
+    batch = run_batch(
+        model, [{"carbon_tax_rate": tax} for tax in taxes], VARIABLES,
+        final_time=final_time, time_step=time_step,
+    )
+    mismatches = []
+    for i, tax in enumerate(taxes):
+        expected = model.run(
+            params={"carbon_tax_rate": tax}, return_columns=VARIABLES,
+            final_time=final_time, time_step=time_step, saveper=time_step,
+        )
+        actual = batch.xs(i, axis=1, level="scenario")
+        for name in VARIABLES:
+            x = expected[name].to_numpy(dtype=float)
+            y = actual[name].to_numpy(dtype=float)
+            if x.shape != y.shape or not np.allclose(
+                y, x, rtol=0, atol=rtol * np.max(np.abs(x)), equal_nan=True
+            ):
+                mismatches.append(f"{name} at tax {tax}")
+    return mismatches
+
+
+class KernelModel:
+    """
+    Stand-in for the loaded PySD model in compute-only code that just reads
+    the values of constants and the time settings (batch_params,
+    summarize_batch, ResultSink, ...). It is backed by the generated kernel,
+    so creating one imports neither PySD nor src/model.py, which keeps
+    worker processes quick to start.
+
+    Parameters:
+    -----------
+    params : dict, optional
+        Values overriding the defaults of the .mdl, like model.run(params=...).
+    kernel : module, optional
+        Kernel module to use. Defaults to load_kernel().
+    """
+
+    def __init__(self, params: Optional[Dict] = None, kernel=None):
+        if kernel is None:
+            kernel = load_kernel()
+        values = {**kernel.CONSTANTS, **kernel.CONTROL}
+        unknown = set(params or {}) - set(values)
+        if unknown:
+            raise NameError(f"{sorted(unknown)} are not constants of the model.")
+        values.update(params or {})
+        self.components = SimpleNamespace(**{
+            name: (lambda value=value: value) for name, value in values.items()
+        })
+        self.time = SimpleNamespace(**{
+            name: getattr(self.components, name) for name in CONTROL_VARIABLES
+        })
@@ -0,0 +1,172 @@
+"""
+Optional Numba-compiled simulation loop for small batches.
+
+For one or a few scenarios, the NumPy batch engine is dominated by the
+interpreter overhead of dozens of tiny array operations per step. The
+generated kernel (src/model_kernel.py) also contains run_scenarios, the
+whole Euler loop of each scenario on scalars; when Numba is installed it is
+compiled here, so that a 120-month run takes microseconds. Without Numba
+the same loop runs as plain Python for batches of up to
+PYTHON_LOOP_SCENARIOS scenarios, and larger batches use run_batch.
+run_compiled makes that choice; the frontier probes of max_tax and the
+static comparison runs of tax_adjustment go through it.
+"""
+
+import importlib.util
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple, Union
+
+from src.utils.batch import (
+    STOCKS,
+    Snapshot,
+    _check_columns,
+    batch_params,
+    run_batch,
+)
+from src.utils.codegen import load_kernel
+
+# Numba itself is only imported when the kernel is first compiled, so that
+# importing this module (and the analysis modules using it) stays quick
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+
+# Largest batch for which the uncompiled scalar loop beats NumPy
+PYTHON_LOOP_SCENARIOS = 8
+
+# Smallest batch for which the compiled loop is run on several threads
+PARALLEL_SCENARIOS = 256
+
+_kernel = None
+_loops = {}
+
+
+def kernel():
+    """
+    The generated kernel module, with run_scenarios compiled (serial and
+    parallel) on first use when Numba is installed.
+    """
+    global _kernel
+    if _kernel is None:
+        module = load_kernel()
+        loop = module.run_scenarios
+        if NUMBA_AVAILABLE:
+            import numba
+            module.prange = numba.prange
+            _loops["serial"] = numba.njit(error_model="numpy", cache=True)(loop)
+            _loops["parallel"] = numba.njit(
+                error_model="numpy", cache=True, parallel=True
+            )(loop)
+        else:
+            _loops["serial"] = _loops["parallel"] = loop
+        _kernel = module
+    return _kernel
+
+
+def use_compiled(n_scenarios: int) -> bool:
+    """
+    Whether run_compiled is faster than run_batch for a batch of this size.
+    """
+    return NUMBA_AVAILABLE or n_scenarios <= PYTHON_LOOP_SCENARIOS
+
+
+def simulate_compiled(
+    c: Dict[str, np.ndarray],
+    final_time: float,
+    time_step: float,
+    return_columns: List[str],
+    saveper: Optional[float] = None,
+    initial_condition: Optional[Snapshot] = None,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Run the scenarios of the constants `c` (from batch_params) through the
+    scalar loop of the kernel.
+
+    Returns:
+    --------
+    The saved times, and for every name in return_columns an array of shape
+    (n_times, n_scenarios).
+    """
+    k = kernel()
+    n = np.size(c["carbon_tax_rate"])
+    if saveper is None:
+        saveper = time_step
+    save_every = max(int(round(saveper / time_step)), 1)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        folded = k.fold_constants(c)
+    K = np.ascontiguousarray(np.column_stack([
+        np.broadcast_to(np.asarray(folded[name], dtype=float), (n,))
+        for name in k.FOLDED
+    ]))
+
+    if initial_condition is None:
+        initial_time = 0
+        S0 = np.zeros((n, len(k.STOCKS)))
+    else:
+        initial_time = initial_condition.time
+        missing = set(STOCKS) - set(initial_condition.stocks)
+        if missing:
+            raise ValueError(f"The initial condition lacks the stocks {sorted(missing)}")
+        S0 = np.ascontiguousarray(np.column_stack([
+            np.broadcast_to(np.asarray(initial_condition.stocks[name], dtype=float), (n,))
+            for name in k.STOCKS
+        ]))
+    n_steps = int(round((final_time - initial_time) / time_step))
+    n_saved = n_steps // save_every + 1
+
+    computed = [name for name in return_columns if name in k.VARIABLES]
+    columns = np.array([k.VARIABLES.index(name) for name in computed], dtype=np.int64)
+    out = np.empty((n, n_saved, len(computed)))
+    loop = _loops["parallel" if n >= PARALLEL_SCENARIOS else "serial"]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        loop(K, S0, initial_condition is None, float(initial_time), n_steps,
+             float(time_step), save_every, columns, out)
+
+    times = initial_time + np.arange(n_saved) * save_every * time_step
+    values = {}
+    for name in return_columns:
+        if name in computed:
+            values[name] = out[:, :, computed.index(name)].T
+        else:
+            # Constants and run constants do not change over the run
+            values[name] = np.broadcast_to(folded[name], (n_saved, n))
+    return times, values
+
+
+def run_compiled(
+    model,
+    params: Union[Dict, List[Dict], pd.DataFrame],
+    return_columns: Optional[List[str]] = None,
+    final_time: int = 120,
+    time_step: float = 1,
+    saveper: Optional[float] = None,
+    initial_condition: Optional[Snapshot] = None,
+) -> pd.DataFrame:
+    """
+    Same as batch.run_batch, through the compiled scalar loop when Numba is
+    installed or the batch is small, and through run_batch otherwise.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+    _check_columns(return_columns)
+
+    c = batch_params(model, params)
+    n = np.size(c["carbon_tax_rate"])
+    if not use_compiled(n):
+        return run_batch(model, c, return_columns, final_time, time_step,
+                         saveper, initial_condition)
+
+    times, values = simulate_compiled(
+        c, final_time, time_step, return_columns, saveper, initial_condition
+    )
+    data = np.concatenate(
+        [values[name] for name in return_columns], axis=1
+    ) if return_columns else np.empty((len(times), 0))
+    columns = pd.MultiIndex.from_product(
+        [return_columns, range(n)], names=["variable", "scenario"]
+    )
+    return pd.DataFrame(data, index=pd.Index(times, name="time"), columns=columns)
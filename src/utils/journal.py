@@ -0,0 +1,120 @@
+"""
+Checkpoint and resume support for long sweeps and searches.
+
+A SweepJournal is an append-only JSON-lines file recording the key (and a
+small result) of every completed scenario, fsynced line by line so that an
+interrupted job can be restarted and skip finished work. Alongside it,
+stock states can be checkpointed mid-simulation and restored.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.utils.cache import _normalize
+
+
+class SweepJournal:
+    """
+    Journal of completed scenarios and store of mid-run state checkpoints.
+
+    Parameters:
+    -----------
+    path : str or Path
+        Journal file. State checkpoints are kept in a "<path>.states"
+        directory next to it.
+
+    A line that was only partially written when the process died is
+    ignored on reload, so the journal never records unfinished work.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_directory = self.path.with_name(self.path.name + ".states")
+        self._entries = {}
+        if self.path.exists():
+            content = self.path.read_bytes()
+            complete = content[:content.rfind(b"\n") + 1]
+            if len(complete) < len(content):
+                # Drop a torn last line so that new records start on a new line
+                with open(self.path, "r+b") as f:
+                    f.truncate(len(complete))
+            for line in complete.decode().splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._entries[entry["key"]] = entry.get("value")
+
+    @staticmethod
+    def key(params, **settings) -> str:
+        """
+        Stable key of a scenario from its parameters and settings.
+        """
+        payload = json.dumps(
+            {"params": _normalize(params), "settings": _normalize(settings)},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, default=None):
+        return self._entries.get(key, default)
+
+    def record(self, key: str, value=None) -> None:
+        """
+        Durably mark key as completed, with an optional JSON-serializable value.
+        """
+        self.record_many({key: value})
+
+    def record_many(self, values: Dict) -> None:
+        """
+        Durably mark several keys as completed with a single fsync.
+        """
+        if not values:
+            return
+        lines = "".join(
+            json.dumps({"key": key, "value": value}) + "\n"
+            for key, value in values.items()
+        )
+        with open(self.path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._entries.update(values)
+
+    def save_state(self, name: str, **arrays) -> None:
+        """
+        Atomically checkpoint named arrays (e.g. time, stocks, tax) as name.
+        """
+        self.state_directory.mkdir(parents=True, exist_ok=True)
+        path = self.state_directory / f"{name}.npz"
+        tmp_path = path.with_name(f"{name}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def load_state(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Arrays of the checkpoint saved as name, or None if there is none.
+        """
+        path = self.state_directory / f"{name}.npz"
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return {key: data[key] for key in data.files}
+        except FileNotFoundError:
+            return None
+
+    def drop_state(self, name: str) -> None:
+        """
+        Remove the checkpoint saved as name once its run has finished.
+        """
+        (self.state_directory / f"{name}.npz").unlink(missing_ok=True)
@@ -1,22 +1,60 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-import yaml
-from pathlib import Path
 from typing import Dict, List
 
+from src.utils.batch import STOCKS, batch_params
+from src.utils.jit import run_compiled
+
+def run_until_unviable(model, params, return_columns=None, final_time=120):
+    """
+    Simulate until viability_flag drops to 0 or final_time is reached.
+
+    Returns a dict with "viable" (flag stayed 1 throughout), "failure_time"
+    (first time the flag is 0, None if viable), "results" (DataFrame of the
+    return_columns up to the stopping time) and "state" (time and values of
+    all stocks at the stopping time).
+    """
+    from pysd.py_backend.output import ModelOutput
+
+    if return_columns is None:
+        return_columns = ["viability_flag"]
+
+    output = ModelOutput()
+    model.set_stepper(
+        output,
+        params=params,
+        return_columns=return_columns,
+        final_time=final_time,
+    )
+
+    failure_time = None
+    while True:
+        if model.components.viability_flag() != 1:
+            failure_time = model.time()
+            break
+        if not model.time.in_bounds():
+            break
+        model.step(1)
+
+    state = {"time": model.time()}
+    for name in STOCKS:
+        state[name] = getattr(model.components, name)()
+
+    return {
+        "viable": failure_time is None,
+        "failure_time": failure_time,
+        "results": output.collect(model),
+        "state": state,
+    }
+
 def calculate_max_viable_tax(model, params, tax_range=None, final_time=120):
     """
     Find the highest carbon tax where viability_flag stays 1 over the simulation period.
-    Uses binary search for efficiency.
+    Uses binary search for efficiency. Each probe stops as soon as viability is lost.
     """
     params_zero = params.copy()
     params_zero["carbon_tax_rate"] = 0
-    result_zero = model.run(
-        params=params_zero,
-        return_columns=["viability_flag"]
-    )
-    if not (result_zero["viability_flag"] == 1).all():
+    if not run_until_unviable(model, params_zero, final_time=final_time)["viable"]:
         return 0
     
     if tax_range is None:
@@ -30,13 +68,9 @@ def calculate_max_viable_tax(model, params, tax_range=None, final_time=120):
     while high - low > 100:  # Stop when range is small enough
         mid = (low + high) // 2
         params_mid["carbon_tax_rate"] = mid
-        result = model.run(
-            params=params_mid,
-            return_columns=["viability_flag"]
-        )
         
         # Check if viability stays 1 throughout
-        if (result["viability_flag"] == 1).all():
+        if run_until_unviable(model, params_mid, final_time=final_time)["viable"]:
             best_tax = mid
             low = mid
         else:
@@ -46,13 +80,135 @@ def calculate_max_viable_tax(model, params, tax_range=None, final_time=120):
     # Fine-tune in the final range
     for tax in range(int(low), int(high) + 1, 100):
         params_tax["carbon_tax_rate"] = tax
-        result = model.run(
-            params=params_tax,
-            return_columns=["viability_flag"]
-        )
-        if (result["viability_flag"] == 1).all():
+        if run_until_unviable(model, params_tax, final_time=final_time)["viable"]:
             best_tax = tax
         else:
             break
     
-    return best_tax
\ No newline at end of file
+    return best_tax
+def viability_slack(model, params, final_time=120, time_step=1):
+    """
+    Continuous distance to the two viability failure conditions.
+
+    The margin slack is the (k+1)-th smallest value of
+    rolling_margin - margin_threshold over the simulated months, where k is
+    the number of months below the threshold that duration_threshold still
+    tolerates: it is negative exactly when the duration condition trips.
+    The profit slack is the minimum over time of cumulative_profit divided by
+    cumulative revenue, negative exactly when cumulative_profit drops below 0.
+    Both are fractions of revenue and viability_flag stays 1 iff their
+    minimum is >= 0.
+
+    `params` is a parameter dict or anything accepted by `run_batch`, and
+    the slack is returned per scenario as an array. Small batches, such as
+    the single probes of solve_max_viable_tax, run on the compiled loop of
+    jit.run_compiled.
+    """
+    results = run_compiled(
+        model,
+        params,
+        return_columns=[
+            "rolling_margin",
+            "cumulative_profit",
+            "revenue",
+            "margin_threshold",
+            "duration_threshold",
+        ],
+        final_time=final_time,
+        time_step=time_step,
+    )
+    rolling_margin = results["rolling_margin"].to_numpy()[:-1]
+    margin_threshold = results["margin_threshold"].to_numpy()[0]
+    duration_threshold = results["duration_threshold"].to_numpy()[0]
+
+    # Months below the threshold needed to exceed duration_threshold
+    n_months = rolling_margin.shape[0]
+    k = np.floor(duration_threshold / time_step).astype(int)
+    below = np.sort(rolling_margin - margin_threshold, axis=0)
+    margin_slack = np.where(
+        k < n_months,
+        np.take_along_axis(below, np.minimum(k, n_months - 1)[None, :], axis=0)[0],
+        np.inf,
+    )
+
+    cumulative_revenue = time_step * np.cumsum(results["revenue"].to_numpy()[:-1], axis=0)
+    profit_slack = np.min(
+        results["cumulative_profit"].to_numpy()[1:] / cumulative_revenue, axis=0
+    )
+
+    return np.minimum(margin_slack, profit_slack)
+
+def solve_max_viable_tax(model, params, tax_range=None, final_time=120, xtol=1.0):
+    """
+    Find the highest viable carbon tax to within xtol by root finding on
+    viability_slack (Illinois variant of regula falsi), keeping a bracket
+    whose lower end is always viable. Returns 0 like calculate_max_viable_tax
+    when the zero-tax run is not viable.
+    """
+    def slack(tax):
+        return viability_slack(
+            model, [dict(params, carbon_tax_rate=tax)], final_time=final_time
+        )[0]
+
+    if tax_range is None:
+        tax_range = (0, 30000)
+
+    low, high = tax_range
+    slack_low = slack(low)
+    if slack_low < 0:
+        return 0
+    slack_high = slack(high)
+    if slack_high >= 0:
+        return high
+
+    side = 0
+    while high - low > xtol:
+        tax = (low * slack_high - high * slack_low) / (slack_high - slack_low)
+        # Fall back to bisection when the secant lands on the bracket
+        if not low < tax < high:
+            tax = (low + high) / 2
+        slack_tax = slack(tax)
+        if slack_tax >= 0:
+            low, slack_low = tax, slack_tax
+            if side == 1:
+                slack_high /= 2
+            side = 1
+        else:
+            high, slack_high = tax, slack_tax
+            if side == -1:
+                slack_low /= 2
+            side = -1
+
+    return low
+
+def max_viable_tax_batch(model, params, tax_range=None, final_time=120, xtol=1.0):
+    """
+    Highest viable carbon tax for many parameter sets at once, by bisection
+    on viability_slack with every probe of every parameter set simulated in
+    one batch. `params` is anything accepted by `run_batch` (its
+    carbon_tax_rate is ignored); returns an array with 0 where the zero-tax
+    run is not viable, like calculate_max_viable_tax.
+    """
+    if tax_range is None:
+        tax_range = (0, 30000)
+
+    constants = batch_params(model, params)
+    n = constants["carbon_tax_rate"].size
+
+    def slack(tax):
+        return viability_slack(
+            model, dict(constants, carbon_tax_rate=tax), final_time=final_time
+        )
+
+    low = np.full(n, float(tax_range[0]))
+    high = np.full(n, float(tax_range[1]))
+    unviable = slack(low) < 0
+    all_viable = slack(high) >= 0
+
+    while np.max(high - low) > xtol:
+        mid = (low + high) / 2
+        viable = slack(mid) >= 0
+        low = np.where(viable, mid, low)
+        high = np.where(viable, high, mid)
+
+    return np.where(unviable, 0.0, np.where(all_viable, float(tax_range[1]), low))
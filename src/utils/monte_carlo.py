@@ -0,0 +1,268 @@
+"""
+Monte Carlo uncertainty propagation with streaming aggregation.
+
+Parameters are drawn from probability distributions, simulated in chunks on
+the NumPy batch engine (in parallel worker processes) and reduced on the fly
+to per-month means, standard deviations and quantile sketches, so memory
+stays O(months x sketch size) however many samples are drawn.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence
+
+from src.utils.batch import (
+    CONSTANTS,
+    _check_columns,
+    batch_params,
+    fold_constants,
+    lookup,
+    simulate,
+)
+
+
+def _sorted_quantiles(values: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    """
+    Quantiles at the given levels of every column of values sorted along
+    axis 0, interpolated linearly like np.quantile. Unlike np.quantile, whose
+    cost grows with the number of levels, this is a single gather.
+    """
+    position = levels * (len(values) - 1)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, len(values) - 1)
+    fraction = (position - below)[:, None]
+    return values[below] * (1 - fraction) + values[above] * fraction
+
+
+class StreamingStats:
+    """
+    Mergeable per-column summary of a stream of rows.
+
+    Keeps the count, mean and sum of squared deviations (Chan et al.) and a
+    quantile sketch: the values at `resolution` evenly spaced probability
+    levels. Merging two sketches evaluates the quantiles of their
+    count-weighted mixture, so the rank error stays of order 1 / resolution.
+    """
+
+    def __init__(self, n_columns: int, resolution: int = 1000):
+        self.levels = (np.arange(resolution) + 0.5) / resolution
+        self.count = 0
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.sketch = None
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Add a block of rows, an array of shape (n_rows, n_columns).
+        """
+        other = StreamingStats(values.shape[1], len(self.levels))
+        other.count = len(values)
+        other.mean = values.mean(axis=0)
+        other.m2 = ((values - other.mean) ** 2).sum(axis=0)
+        other.sketch = _sorted_quantiles(np.sort(values, axis=0), other.levels)
+        self.merge(other)
+
+    def merge(self, other: "StreamingStats") -> None:
+        """
+        Fold another summary of the same columns into this one.
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.sketch = other.sketch
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.mean = self.mean + delta * other.count / count
+
+        values = np.concatenate([self.sketch, other.sketch])
+        weights = np.concatenate([
+            np.full(len(self.sketch), self.count / len(self.sketch)),
+            np.full(len(other.sketch), other.count / len(other.sketch)),
+        ])
+        order = np.argsort(values, axis=0)
+        values = np.take_along_axis(values, order, axis=0)
+        weights = weights[order]
+        ranks = np.cumsum(weights, axis=0) - weights / 2
+        targets = self.levels * count
+        self.sketch = np.stack(
+            [np.interp(targets, ranks[:, j], values[:, j]) for j in range(values.shape[1])],
+            axis=1,
+        )
+        self.count = count
+
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        Interpolated q-quantile of every column.
+        """
+        return np.array([
+            np.interp(q, self.levels, self.sketch[:, j])
+            for j in range(self.sketch.shape[1])
+        ])
+
+
+def _draw(distributions, n, rng):
+    samples = {}
+    for name, distribution in distributions.items():
+        if callable(distribution):
+            samples[name] = np.asarray(distribution(rng, n), dtype=float)
+        else:
+            samples[name] = distribution.rvs(size=n, random_state=rng)
+    return samples
+
+
+def _run_chunk(seed, n, constants, distributions, return_columns,
+               final_time, time_step, resolution):
+    """
+    Draw and simulate one chunk of samples and summarize its trajectories.
+    """
+    rng = np.random.default_rng(seed)
+    params = dict(constants)
+    params.update(_draw(distributions, n, rng))
+    c = fold_constants(batch_params(None, params))
+
+    n_steps = int(round(final_time / time_step))
+    trajectories = {name: np.empty((n, n_steps + 1)) for name in return_columns}
+
+    def record(i, c, s, a):
+        for name in return_columns:
+            trajectories[name][:, i] = lookup(name, c, s, a)
+
+    simulate(c, final_time, time_step, record)
+
+    stats = {}
+    for name in return_columns:
+        stats[name] = StreamingStats(n_steps + 1, resolution)
+        stats[name].update(trajectories[name])
+    return stats
+
+
+def monte_carlo(
+    model,
+    base_params: Dict,
+    distributions: Dict,
+    n_samples: int = 100000,
+    return_columns: Optional[List[str]] = None,
+    quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+    final_time: int = 120,
+    time_step: float = 1,
+    seed: Optional[int] = 0,
+    chunksize: int = 10000,
+    workers: Optional[int] = None,
+    resolution: int = 1000,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> pd.DataFrame:
+    """
+    Propagate parameter uncertainty to per-month trajectory statistics.
+
+    Parameters:
+    -----------
+    model : PySD model
+        The loaded PySD model (provides constants missing from base_params)
+    base_params : dict
+        Values of the constants that are not sampled
+    distributions : dict
+        Maps constant names to frozen scipy.stats distributions, e.g.
+        {"elasticity_lr": stats.norm(-0.6, 0.1)}, or to callables
+        f(rng, size) returning samples. With workers > 1 they must be
+        picklable (no lambdas).
+    n_samples : int
+        Number of Monte Carlo samples
+    return_columns : list, optional
+        Variables to summarize. Defaults to cumulative metrics.
+    quantiles : sequence of float
+        Quantile levels to report per month
+    final_time : int
+        Simulation length in months (default: 120)
+    time_step : float
+        Euler time step in months (default: 1)
+    seed : int, optional
+        Seed of the root SeedSequence. Every chunk draws from its own
+        spawned stream, so results do not depend on the number of workers.
+    chunksize : int
+        Samples simulated at once by a worker
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+        With workers=1 everything runs in the calling process.
+    resolution : int
+        Number of probability levels kept by each quantile sketch
+    progress : callable, optional
+        Called as progress(n_done, n_samples) whenever a chunk completes.
+
+    Returns:
+    --------
+    DataFrame indexed by time with (variable, statistic) columns, where
+    statistic is "mean", "std" or one of the quantile levels, e.g.
+    result["cumulative_co2"][0.05]. The mean of viability_flag is the share
+    of viable samples.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+    _check_columns(return_columns)
+    constants = {
+        name: float(value[0])
+        for name, value in batch_params(model, base_params).items()
+    }
+    unknown = [name for name in distributions if name not in CONSTANTS]
+    if unknown:
+        raise NameError(f"{unknown} are not constants of the model.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    sizes = [
+        min(chunksize, n_samples - start) for start in range(0, n_samples, chunksize)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (constants, distributions, return_columns, final_time, time_step, resolution)
+
+    n_steps = int(round(final_time / time_step))
+    totals = {name: StreamingStats(n_steps + 1, resolution) for name in return_columns}
+    pending = {}
+    next_chunk = 0
+    n_done = 0
+
+    def collect(index, stats):
+        # Merge in chunk order so that results are reproducible
+        nonlocal next_chunk, n_done
+        pending[index] = stats
+        while next_chunk in pending:
+            for name, chunk_stats in pending.pop(next_chunk).items():
+                totals[name].merge(chunk_stats)
+            next_chunk += 1
+        n_done += sizes[index]
+        if progress is not None:
+            progress(n_done, n_samples)
+
+    if workers == 1:
+        for index, (size, chunk_seed) in enumerate(zip(sizes, seeds)):
+            collect(index, _run_chunk(chunk_seed, size, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_run_chunk, chunk_seed, size, *args): index
+                for index, (size, chunk_seed) in enumerate(zip(sizes, seeds))
+            }
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+
+    columns = {}
+    for name in return_columns:
+        columns[(name, "mean")] = totals[name].mean
+        columns[(name, "std")] = totals[name].std()
+        for q in quantiles:
+            columns[(name, q)] = totals[name].quantile(q)
+    result = pd.DataFrame(columns, index=pd.Index(np.arange(n_steps + 1) * time_step, name="time"))
+    result.columns.names = ["variable", "statistic"]
+    return result
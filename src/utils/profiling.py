@@ -0,0 +1,166 @@
+"""
+Per-component profiling of PySD runs.
+
+ComponentProfiler temporarily wraps every component function of a loaded
+model, and the ddt/update methods of its stateful elements, to record call
+counts, cumulative and self time and step-cache hits. The results collect in
+a ComponentProfile, which can be merged across runs and processes (see the
+`profile` argument of sweep.run_sweep) and reported as a table or as
+collapsed stacks for flame graph tools.
+
+Constants are served by PySD's run cache during model.run without calling
+their function, so they only appear with the evaluation that fills it.
+"""
+
+import functools
+import pandas as pd
+from collections import defaultdict
+from time import perf_counter
+from typing import Dict, Optional
+
+
+class ComponentProfile:
+    """
+    Call counts, times (in seconds) and cache hits per component, and self
+    time per call stack.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.cumulative_time = defaultdict(float)
+        self.self_time = defaultdict(float)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.stacks = defaultdict(float)
+
+    def merge(self, other: "ComponentProfile") -> None:
+        """
+        Add the measurements of another profile, e.g. of a worker process.
+        """
+        for name in ("calls", "cumulative_time", "self_time", "cache_hits",
+                     "cache_misses", "stacks"):
+            totals = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                totals[key] += value
+
+    def table(self) -> pd.DataFrame:
+        """
+        One row per component or stateful update, by decreasing self time.
+        cache_hit_rate is NaN for components without step cache.
+        """
+        frame = pd.DataFrame({
+            "calls": pd.Series(self.calls, dtype=int),
+            "cumulative_time": pd.Series(self.cumulative_time, dtype=float),
+            "self_time": pd.Series(self.self_time, dtype=float),
+            "cache_hits": pd.Series(self.cache_hits, dtype=float),
+            "cache_misses": pd.Series(self.cache_misses, dtype=float),
+        })
+        frame["self_time_per_call"] = frame["self_time"] / frame["calls"]
+        frame["cache_hit_rate"] = frame["cache_hits"] / (
+            frame["cache_hits"] + frame["cache_misses"]
+        )
+        frame.index.name = "component"
+        return frame.sort_values("self_time", ascending=False)
+
+    def collapsed(self) -> str:
+        """
+        Self time per call stack in the collapsed format of flamegraph.pl and
+        speedscope ("outer;inner microseconds" per line).
+        """
+        return "".join(
+            f"{';'.join(stack)} {round(seconds * 1e6)}\n"
+            for stack, seconds in sorted(self.stacks.items())
+        )
+
+    def write_collapsed(self, path) -> None:
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+
+class ComponentProfiler:
+    """
+    Context manager instrumenting a loaded PySD model while it is active.
+
+    Parameters:
+    -----------
+    model : PySD model
+        The model to instrument. Any run, stepping or sweep using it inside
+        the `with` block is profiled.
+    profile : ComponentProfile, optional
+        Profile to add the measurements to. A new one by default.
+
+    Example:
+    --------
+    with ComponentProfiler(model) as profiler:
+        model.run(params=params)
+    print(profiler.profile.table().head(10))
+    """
+
+    def __init__(self, model, profile: Optional[ComponentProfile] = None):
+        self.model = model
+        self.profile = profile if profile is not None else ComponentProfile()
+        self._stack = []
+        self._components: Dict[str, object] = {}
+        self._statefuls = []
+
+    def _wrap(self, name, function, cached=False):
+        profile = self.profile
+        stack = self._stack
+        cache = self.model.cache
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            if cached:
+                if name in cache.data:
+                    profile.cache_hits[name] += 1
+                else:
+                    profile.cache_misses[name] += 1
+            stack.append([name, 0.0])
+            start = perf_counter()
+            try:
+                return function(*args)
+            finally:
+                elapsed = perf_counter() - start
+                _, children = stack.pop()
+                path = tuple(frame[0] for frame in stack) + (name,)
+                profile.calls[name] += 1
+                profile.self_time[name] += elapsed - children
+                profile.stacks[path] += elapsed - children
+                if name not in path[:-1]:
+                    # Recursive calls are already in the outer call's time
+                    profile.cumulative_time[name] += elapsed
+                if stack:
+                    stack[-1][1] += elapsed
+
+        return wrapper
+
+    def __enter__(self):
+        components = self.model.components
+        for name in set(self.model._namespace.values()) - {"time"}:
+            function = getattr(components, name, None)
+            if callable(function):
+                cached = name in self.model.cache.cached_funcs
+                self._components[name] = self._wrap(name, function, cached)
+                components._set_component(name, self._components[name])
+        for element in self.model._dynamicstateful_elements:
+            name = getattr(element, "py_name", type(element).__name__)
+            for method in ("ddt", "update"):
+                # Integ keeps its ddt as an instance attribute
+                self._statefuls.append((element, method, element.__dict__.get(method)))
+                setattr(element, method,
+                        self._wrap(f"{name}.{method}", getattr(element, method)))
+        return self
+
+    def __exit__(self, *exc_info):
+        components = self.model.components
+        for name, wrapper in self._components.items():
+            # Components replaced meanwhile (e.g. by params) stay replaced
+            if getattr(components, name) is wrapper:
+                components._set_component(name, wrapper.__wrapped__)
+        for element, method, original in self._statefuls:
+            if original is None:
+                delattr(element, method)
+            else:
+                setattr(element, method, original)
+        self._components.clear()
+        self._statefuls.clear()
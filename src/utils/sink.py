@@ -0,0 +1,193 @@
+"""
+Chunked Parquet / Arrow IPC writer for large sweeps.
+
+Results are appended to a directory of part files of bounded size instead of
+being accumulated in memory, so a long ensemble survives a crash up to the
+last flushed part and can be read back lazily with column projection.
+Requires pyarrow.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.cache import MODEL_FILES, file_digest
+
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+METADATA_KEY = b"freight_model"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "Writing and reading chunked results requires pyarrow "
+            "(pip install pyarrow)."
+        ) from e
+    return pyarrow
+
+
+class ResultSink:
+    """
+    Streaming writer of result DataFrames to part files.
+
+    Parameters:
+    -----------
+    directory : str or Path
+        Output directory. Existing parts are kept and numbering continues,
+        so a resumed sweep appends to the same dataset.
+    model : PySD model, optional
+        If given, its time settings are recorded in the schema metadata.
+    file_format : str
+        "parquet" (default) or "arrow" (Arrow IPC files).
+    rows_per_file : int
+        Rows buffered before a part file is written.
+    metadata : dict, optional
+        Further JSON-serializable metadata, e.g. the sweep definition.
+
+    Every part carries, under the b"freight_model" schema metadata key, the
+    hash of the model files and the time settings.
+    """
+
+    def __init__(self, directory, model=None, file_format: str = "parquet",
+                 rows_per_file: int = 100000, metadata: Optional[Dict] = None):
+        if file_format not in FORMATS:
+            raise ValueError(f"file_format must be one of {list(FORMATS)}")
+        self.pa = _pyarrow()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.file_format = file_format
+        self.rows_per_file = rows_per_file
+        self.metadata = {"model_hash": file_digest(MODEL_FILES)}
+        if model is not None:
+            self.metadata.update({
+                "initial_time": model.time.initial_time(),
+                "final_time": model.time.final_time(),
+                "time_step": model.time.time_step(),
+                "saveper": model.time.saveper(),
+            })
+        self.metadata.update(metadata or {})
+        self.schema = None
+        self._buffer = []
+        self._buffered_rows = 0
+        self._part = len(list(self.directory.glob(f"part-*.{file_format}")))
+
+    def declare(self, dtypes: Dict[str, object]) -> None:
+        """
+        Fix the columns and their types (pandas/NumPy dtypes, object for
+        strings) before the first write, for writers whose chunks may lack
+        columns or hold only missing values in some of them. Has no effect
+        once the schema is set.
+        """
+        if self.schema is not None:
+            return
+        pa = self.pa
+        fields = [
+            pa.field(name, pa.string() if np.dtype(dtype) == object
+                     else pa.from_numpy_dtype(np.dtype(dtype)))
+            for name, dtype in dtypes.items()
+        ]
+        self.schema = pa.schema(fields).with_metadata(
+            {METADATA_KEY: json.dumps(self.metadata).encode()}
+        )
+
+    def _to_table(self, frame: pd.DataFrame):
+        pa = self.pa
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.schema is not None:
+            for field in self.schema:
+                if field.name not in table.column_names:
+                    table = table.append_column(
+                        field.name, pa.nulls(len(table), field.type)
+                    )
+        if self.schema is None:
+            # Columns that are all None in the first chunk (e.g. "error")
+            # would otherwise get the null type and reject later strings
+            fields = [
+                pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                for f in table.schema
+            ]
+            self.schema = pa.schema(fields).with_metadata(
+                {METADATA_KEY: json.dumps(self.metadata).encode()}
+            )
+        return table.select(self.schema.names).cast(self.schema)
+
+    @property
+    def buffered_rows(self) -> int:
+        """
+        Rows written to the sink but not yet flushed to a part file.
+        """
+        return self._buffered_rows
+
+    def write(self, frame: pd.DataFrame) -> None:
+        """
+        Append rows, writing a part file whenever rows_per_file are buffered.
+        """
+        self._buffer.append(frame)
+        self._buffered_rows += len(frame)
+        if self._buffered_rows >= self.rows_per_file:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows to a new part file.
+        """
+        if not self._buffer:
+            return
+        pa = self.pa
+        table = self._to_table(pd.concat(self._buffer, ignore_index=True))
+        path = self.directory / f"part-{self._part:05d}.{self.file_format}"
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if self.file_format == "parquet":
+            pa.parquet.write_table(table, tmp_path)
+        else:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        tmp_path.replace(path)
+        self._part += 1
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_results(directory, file_format: str = "parquet"):
+    """
+    Lazy pyarrow dataset over the part files written by a ResultSink.
+    """
+    pa = _pyarrow()
+    return pa.dataset.dataset(
+        sorted(str(p) for p in Path(directory).glob(f"part-*.{file_format}")),
+        format=FORMATS[file_format],
+    )
+
+
+def read_results(directory, columns: Optional[List[str]] = None,
+                 file_format: str = "parquet", filter=None) -> pd.DataFrame:
+    """
+    Read back the results of a ResultSink, loading only the given columns
+    (and rows matching an optional pyarrow.dataset filter expression).
+    """
+    dataset = open_results(directory, file_format)
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+
+def result_metadata(directory, file_format: str = "parquet") -> Dict:
+    """
+    Model hash, time settings and user metadata recorded with the results.
+    """
+    metadata = open_results(directory, file_format).schema.metadata or {}
+    return json.loads(metadata.get(METADATA_KEY, b"{}"))
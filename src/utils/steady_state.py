@@ -0,0 +1,162 @@
+"""
+Closed-form steady state of the model and analytic baselines.
+
+Without freight activity growth the model has a unique equilibrium for
+every parameter set: fuel efficiency settles where the cost pressure on
+efficiency balances degradation (fuel cost per km back at its baseline when
+degradation_rate is 0), carbon intensity at its target, and prices, demand
+and margins follow. When a run starts in that equilibrium (e.g. at zero
+tax), all flows are constant and the cumulative stocks are known without
+simulating.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional
+
+from src.utils.batch import (
+    STOCKS,
+    batch_params,
+    fold_constants,
+    initial_state,
+)
+from src.utils.summary import summarize_batch
+
+CUMULATIVE_STOCKS = [
+    "cumulative_co2",
+    "cumulative_profit",
+    "duration_below_margin_threshold",
+]
+
+
+def steady_state(model, params) -> Dict[str, np.ndarray]:
+    """
+    Equilibrium values of the stocks (except the cumulative ones) and of the
+    main auxiliaries, as arrays of shape (n_scenarios,).
+
+    params is accepted in any form of batch.batch_params. Scenarios without
+    an equilibrium (nonzero freight_activity_growth_rate, or degradation
+    faster than cost pressure can offset) are NaN.
+    """
+    c = fold_constants(batch_params(model, params))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # improvement = degradation <=> efficiency_target / afe = 1 + r
+        r = c["tau_eff"] * c["degradation_rate"]
+        headroom = c["max_efficiency"] - 1
+        cost_pressure = r * c["cost_pressure_at_max_improvement"] / (headroom - r)
+        fuel_cost_per_km = c["baseline_fuel_cost_per_km"] * (
+            1 + cost_pressure / c["cost_pressure_sensitivity"]
+        )
+        afe = c["fuel_price"] / fuel_cost_per_km
+        # Without cost pressure sensitivity efficiency only moves through
+        # degradation, so it stays at its initial value when that is zero
+        afe = np.where(
+            (c["cost_pressure_sensitivity"] == 0) & (r == 0),
+            c["baseline_fuel_efficiency"],
+            afe,
+        )
+        fuel_cost_per_km = c["fuel_price"] / afe
+        feasible = (
+            (c["freight_activity_growth_rate"] == 0)
+            & (r >= 0) & (r < headroom)
+            & np.isfinite(afe) & (afe > 0)
+        )
+
+        price = c["baseline_freight_price"] + c["desired_passthrough_share"] * (
+            fuel_cost_per_km - c["baseline_fuel_cost_per_km"]
+        )
+        underlying = c["baseline_demand"]
+        relative_price = price / c["baseline_freight_price"]
+        shortrun = underlying * relative_price ** c["elasticity_sr"] - underlying
+        longrun = underlying * relative_price ** c["elasticity_lr"] - underlying
+        activity = underlying + shortrun + longrun
+        emissions = activity / afe * c["target_carbon_intensity"]
+        revenue = activity * price
+        profit = revenue - activity * (c["nonfuel_cost_per_km"] + fuel_cost_per_km)
+        margin = profit / revenue
+
+    values = {
+        "average_fuel_efficiency": afe,
+        "carbon_intensity_of_fuel": c["target_carbon_intensity"],
+        "underlying_freight_activity": underlying,
+        "effective_passthrough_share": c["desired_passthrough_share"],
+        "longrun_price_effect_on_demand": longrun,
+        "perceived_freight_price": price,
+        "rolling_margin": margin,
+        "shortrun_price_effect_on_demand": shortrun,
+        "fuel_cost_per_km": fuel_cost_per_km,
+        "freight_activity": activity,
+        "emissions": emissions,
+        "revenue": revenue,
+        "profit": profit,
+        "margin": margin,
+    }
+    return {
+        name: np.where(feasible, np.broadcast_to(value, feasible.shape), np.nan)
+        for name, value in values.items()
+    }
+
+
+def at_equilibrium(model, params, rtol: float = 1e-9) -> np.ndarray:
+    """
+    Whether each scenario starts in its steady state, so that every
+    variable except the cumulative stocks stays constant over the run.
+    """
+    c = fold_constants(batch_params(model, params))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        start = initial_state(c)
+    equilibrium = steady_state(model, params)
+    result = np.ones(np.size(c["carbon_tax_rate"]), dtype=bool)
+    for name in STOCKS:
+        if name not in CUMULATIVE_STOCKS:
+            result &= np.isclose(start[name], equilibrium[name], rtol=rtol, atol=0)
+    return result
+
+
+def baseline_values(model, params, final_time: int = 120, time_step: float = 1,
+                    return_columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Final cumulative_co2, cumulative_profit and viability_flag (as in
+    summarize_batch(...).final), computed analytically for the scenarios
+    that start in equilibrium and by simulation for the others.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+    unsupported = set(return_columns) - {"cumulative_co2", "cumulative_profit",
+                                         "viability_flag"}
+    if unsupported:
+        raise NameError(f"{sorted(unsupported)} have no analytic baseline.")
+
+    c = batch_params(model, params)
+    equilibrium = steady_state(model, c)
+    analytic = at_equilibrium(model, c)
+
+    # Euler accumulation of constant flows over n_steps steps
+    elapsed = int(round(final_time / time_step)) * time_step
+    below = equilibrium["margin"] < c["margin_threshold"]
+    duration = np.where(below, elapsed, 0)
+    values = {
+        "cumulative_co2": equilibrium["emissions"] * elapsed,
+        "cumulative_profit": equilibrium["profit"] * elapsed,
+    }
+    values["viability_flag"] = np.where(
+        (duration > c["duration_threshold"]) | (values["cumulative_profit"] < 0), 0, 1
+    )
+
+    if not analytic.all():
+        simulated = summarize_batch(
+            model,
+            {name: value[~analytic] for name, value in c.items()},
+            return_columns,
+            final_time=final_time,
+            time_step=time_step,
+        ).final
+        for name in return_columns:
+            values[name] = np.asarray(values[name], dtype=float)
+            values[name][~analytic] = simulated[name]
+    # The flag is integer whether or not some scenarios were simulated
+    values["viability_flag"] = np.asarray(values["viability_flag"]).astype(np.int64)
+    return {name: values[name] for name in return_columns}
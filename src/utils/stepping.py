@@ -0,0 +1,116 @@
+"""
+Stepping a PySD model with inputs that take effect immediately.
+
+PySD evaluates every auxiliary at most once per time step through its step
+cache, whose cache types come from the depends_on metadata of src/model.py,
+and clears the cache whenever time advances. model.step, however, sets new
+stepper inputs without clearing it, so the next Euler step still uses the
+auxiliaries cached at the current time under the old inputs and a new input
+only takes effect one step later. step() below invalidates exactly the
+cached values that depend on the inputs that changed.
+
+PySD also evaluates the components that only depend on constants once per
+run (its run cache), but in stepper mode everything downstream of a stepper
+input is treated as time-dependent and recomputed every step. step() keeps
+such parameter-only values across time steps until an input changes.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+
+def _dependents(model) -> Dict[str, Set[str]]:
+    """
+    Components using each component within a time step. Stocks are not
+    followed: their value is the stored state, whatever their inputs.
+    """
+    dependents = defaultdict(set)
+    for element, dependencies in model._dependencies.items():
+        if element.startswith("_") or not isinstance(dependencies, dict):
+            continue
+        for dependency in dependencies:
+            dependents[dependency].add(element)
+    return dependents
+
+
+def downstream(model, names: Iterable[str]) -> Set[str]:
+    """
+    The given components and every component whose value, at a fixed state,
+    depends on one of them.
+    """
+    dependents = _dependents(model)
+    result, frontier = set(), list(names)
+    while frontier:
+        name = frontier.pop()
+        if name not in result:
+            result.add(name)
+            frontier.extend(dependents.get(name, ()))
+    return result
+
+
+def run_constants(model, inputs: Iterable[str] = ()) -> Set[str]:
+    """
+    Components that, according to the depends_on metadata of the model, only
+    depend on constants and on the given inputs (e.g. stepper variables,
+    whose dependencies PySD replaces by time), so that their value is fixed
+    for a parameter set and stepper input values.
+    """
+    inputs = set(inputs)
+    dependencies = model._dependencies
+    result, varying = set(inputs), {"time"}
+
+    def constant(name):
+        if name in result:
+            return True
+        if name in varying:
+            return False
+        deps = dependencies.get(name)
+        is_constant = (
+            not name.startswith("_")
+            and isinstance(deps, dict)
+            and all(constant(dep) for dep in deps)
+        )
+        (result if is_constant else varying).add(name)
+        return is_constant
+
+    for name in dependencies:
+        constant(name)
+    return result - {"OUTPUTS"}
+
+
+def invalidate(model, names: Iterable[str]) -> None:
+    """
+    Drop the step-cached values that depend on the given components.
+    """
+    data = model.cache.data
+    for name in downstream(model, names) & data.keys():
+        del data[name]
+
+
+def step(model, step_vars: Optional[Dict] = None, num_steps: int = 1) -> None:
+    """
+    Same as model.step, but inputs in step_vars that differ from their
+    current value are used from the current step on, and the step-cached
+    components that only depend on constants and step_vars are evaluated
+    once until an input changes instead of at every step.
+    """
+    step_vars = step_vars or {}
+    changed = [
+        name for name, value in step_vars.items()
+        if getattr(model.components, name)() != value
+    ]
+    model._set_components(step_vars, new=False)
+    if changed:
+        invalidate(model, changed)
+
+    folded = run_constants(model, step_vars) & model.cache.cached_funcs
+    for _ in range(num_steps):
+        # Model._integrate_step, keeping the folded values
+        model._euler_step(model.time.time_step())
+        data = model.cache.data
+        values = {name: data[name] for name in folded if name in data}
+        model.time.update(model.time() + model.time.time_step())
+        model.clean_caches()
+        model.cache.data.update(values)
+        if model.time.in_return():
+            model.output.update(model)
@@ -0,0 +1,163 @@
+"""
+Final-values-only run mode.
+
+Instead of materializing one DataFrame row per time step, these runs keep
+only the final value of each return column and a few running reductions
+(minimum, maximum and whether the value stayed equal to 1, as used for
+viability_flag).
+"""
+
+import numpy as np
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+from src.utils.batch import (
+    CONSTANTS,
+    VARIABLES,
+    Snapshot,
+    batch_params,
+    fold_constants,
+    lookup,
+    simulate,
+)
+from src.utils.jit import simulate_compiled
+
+
+class RunSummary(NamedTuple):
+    """
+    Final values and running reductions, each a dict keyed by column name.
+    Values are scalars for a single run and arrays of shape (n_scenarios,)
+    for a batch.
+    """
+    final: Dict
+    min: Dict
+    max: Dict
+    all_one: Dict
+
+
+class SummaryHandler:
+    """
+    PySD output handler that reduces every captured value on the fly.
+    """
+
+    def __init__(self):
+        self.capture_elements_step = []
+        self.capture_elements_run = []
+
+    def initialize(self, model):
+        self.final, self.min, self.max, self.all_one = {}, {}, {}, {}
+
+    def _reduce(self, key, value):
+        if key in self.final:
+            self.min[key] = min(self.min[key], value)
+            self.max[key] = max(self.max[key], value)
+            self.all_one[key] = self.all_one[key] and value == 1
+        else:
+            self.min[key] = self.max[key] = value
+            self.all_one[key] = value == 1
+        self.final[key] = value
+
+    def update(self, model):
+        for key in self.capture_elements_step:
+            self._reduce(key, getattr(model.components, key)())
+
+    def add_run_elements(self, model):
+        for key in self.capture_elements_run:
+            self._reduce(key, getattr(model.components, key)())
+
+    def postprocess(self, **kwargs):
+        return RunSummary(self.final, self.min, self.max, self.all_one)
+
+
+@lru_cache(maxsize=None)
+def _summary_output():
+    """
+    ModelOutput subclass that collects a RunSummary instead of a DataFrame,
+    defined on first use so that the batch functions do not import PySD.
+    """
+    from pysd.py_backend.output import ModelOutput
+
+    class SummaryOutput(ModelOutput):
+        def __init__(self):
+            self.handler = SummaryHandler()
+
+    return SummaryOutput
+
+
+def run_summary(model, params, return_columns: Optional[List[str]] = None,
+                final_time: int = 120) -> RunSummary:
+    """
+    Final values and running reductions of return_columns for one parameter
+    set, as scalars.
+
+    When params only sets constants and return_columns are variables of the
+    batch engine, the run goes through the scalar loop of jit.run_compiled
+    (Numba-compiled if installed), which does not evaluate the model through
+    PySD at all. Otherwise the PySD model is stepped with an output handler
+    that keeps only the reductions: that saves building the output
+    DataFrame, but not PySD's per-step evaluation, so it is hardly faster
+    than model.run.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+
+    if set(params) <= set(CONSTANTS) and set(return_columns) <= set(VARIABLES):
+        _, values = simulate_compiled(
+            batch_params(model, params), final_time, 1, return_columns
+        )
+        return RunSummary(
+            {name: float(values[name][-1, 0]) for name in return_columns},
+            {name: float(values[name][:, 0].min()) for name in return_columns},
+            {name: float(values[name][:, 0].max()) for name in return_columns},
+            {name: bool(np.all(values[name][:, 0] == 1)) for name in return_columns},
+        )
+
+    output = _summary_output()()
+    model.set_stepper(
+        output,
+        params=params,
+        return_columns=return_columns,
+        final_time=final_time,
+    )
+    while model.time.in_bounds():
+        model.step(1)
+    return output.collect(model)
+
+
+def summarize_batch(model, params, return_columns: Optional[List[str]] = None,
+                    final_time: int = 120, time_step: float = 1,
+                    initial_condition: Optional[Snapshot] = None) -> RunSummary:
+    """
+    Batch-engine equivalent of run_summary for many parameter sets at once
+    (see batch.run_batch for the accepted params and initial_condition).
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+
+    c = fold_constants(batch_params(model, params))
+    n = np.size(c["carbon_tax_rate"])
+    final, low, high, all_one = {}, {}, {}, {}
+
+    def reduce(i, c, s, a):
+        for name in return_columns:
+            value = np.broadcast_to(lookup(name, c, s, a), (n,))
+            if i == 0:
+                low[name] = value.copy()
+                high[name] = value.copy()
+                all_one[name] = value == 1
+            else:
+                np.minimum(low[name], value, out=low[name])
+                np.maximum(high[name], value, out=high[name])
+                all_one[name] &= value == 1
+            final[name] = value
+
+    simulate(c, final_time, time_step, reduce, initial_condition)
+    return RunSummary(final, low, high, all_one)
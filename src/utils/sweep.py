@@ -0,0 +1,288 @@
+"""
+Parallel parameter sweeps around the PySD `model.run`.
+
+Each worker process loads src/model.py once and then simulates chunks of
+parameter dicts, so large grids use every core instead of a single
+notebook process.
+"""
+
+import multiprocessing
+import os
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from src.utils.cache import file_digest
+from src.utils.journal import SweepJournal
+from src.utils.profiling import ComponentProfile, ComponentProfiler
+
+MODEL_FILE = Path(__file__).resolve().parents[1] / "model.py"
+
+_model = None
+_model_file = None
+_defaults = {}
+
+
+def _init_worker(model_file, reload=True):
+    """
+    Load the model once per worker process. With reload False, a model
+    already loaded from model_file (inherited from the parent when workers
+    are forked) is kept.
+    """
+    global _model, _model_file
+    if reload or _model is None or _model_file != str(model_file):
+        import pysd
+        _model = pysd.load(str(model_file))
+        _model_file = str(model_file)
+    _defaults.clear()
+
+
+def _run_chunk(chunk, return_columns, final_only, profile=False):
+    """
+    Run a chunk of (index, params) pairs, capturing errors per task. With
+    profile True, the chunk is run under a ComponentProfiler and its
+    ComponentProfile is returned too.
+    """
+    if profile:
+        with ComponentProfiler(_model) as profiler:
+            return _run_chunk(chunk, return_columns, final_only)[0], profiler.profile
+
+    results = []
+    for index, params in chunk:
+        try:
+            # model.run keeps the params it was given, so restore the values
+            # earlier tasks overrode to make results independent of chunking
+            for name in params:
+                if name not in _defaults:
+                    _defaults[name] = getattr(_model.components, name)()
+            result = _model.run(
+                params={**_defaults, **params}, return_columns=return_columns
+            )
+            if final_only:
+                result = result.iloc[[-1]]
+            results.append((index, result, None))
+        except Exception:
+            results.append((index, None, traceback.format_exc()))
+    return results, None
+
+
+def _tidy(index, params, result, error, varying, return_columns):
+    if result is None:
+        frame = pd.DataFrame({
+            name: [float("nan")] for name in ["time", *return_columns]
+        })
+    else:
+        frame = result.reset_index()
+    frame.insert(0, "scenario", index)
+    for position, name in enumerate(varying, start=1):
+        frame.insert(position, name, params.get(name))
+    frame["error"] = error
+    return frame
+
+
+def run_sweep(
+    params_list: List[Dict],
+    return_columns: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    final_only: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+    model_file: Optional[str] = None,
+    sink=None,
+    journal: Optional[SweepJournal] = None,
+    profile: Optional[ComponentProfile] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Run `model.run` for every parameter dict on a pool of worker processes.
+
+    Parameters:
+    -----------
+    params_list : list of dict
+        Parameter sets to simulate, one per scenario.
+    return_columns : list, optional
+        Columns to return from model runs. Defaults to cumulative metrics.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+        With workers=1 the sweep runs in the calling process.
+    chunksize : int, optional
+        Number of scenarios sent to a worker at once. Defaults to spreading
+        the sweep over about four chunks per worker.
+    final_only : bool
+        If True, keep only the last time step of each run.
+    progress : callable, optional
+        Called as progress(n_done, n_total) whenever a chunk completes.
+    model_file : str, optional
+        Path to the translated model. Defaults to src/model.py.
+    sink : sink.ResultSink, optional
+        If given, the rows of every chunk are written to the sink as soon as
+        it completes (in completion order) instead of being kept in memory,
+        and None is returned. The sink is flushed at the end.
+    journal : journal.SweepJournal, optional
+        If given, every scenario is recorded in the journal once its results
+        are safe (returned rows are stored in the journal; with a sink, keys
+        are recorded when the sink has flushed them), and scenarios already
+        recorded are skipped. Rerunning an interrupted sweep with the same
+        journal only simulates the missing scenarios. Failed scenarios are
+        recorded with their error and not rerun either, so the sink holds
+        exactly one set of rows per scenario; use a new journal (and sink)
+        to retry them.
+        Without a sink it requires final_only, so that the journal holds
+        one row per scenario rather than whole trajectories.
+    profile : profiling.ComponentProfile, optional
+        If given, every chunk is run under a ComponentProfiler and the
+        per-component call counts and times of all workers are added to it.
+
+    Returns:
+    --------
+    DataFrame in input order with a "scenario" column (position in
+    params_list), the parameters that vary across params_list, "time"
+    (unless final_only), the return columns and an "error" column holding
+    the traceback of failed runs (None otherwise).
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+    if model_file is None:
+        model_file = MODEL_FILE
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if journal is not None and sink is None and not final_only:
+        raise ValueError(
+            "A journal keeps the returned rows of every scenario: use a sink "
+            "for trajectories, or final_only=True."
+        )
+
+    n_total = len(params_list)
+    tasks = list(enumerate(params_list))
+    if journal is not None:
+        digest = file_digest([model_file])
+        scenario_keys = [
+            journal.key(
+                params, return_columns=return_columns, final_only=final_only,
+                model=digest,
+            )
+            for params in params_list
+        ]
+        tasks = [
+            (index, params) for index, params in tasks
+            if scenario_keys[index] not in journal
+        ]
+    n_todo = len(tasks)
+    if chunksize is None:
+        chunksize = max(1, -(-n_todo // (4 * workers)))
+    chunks = [tasks[i:i + chunksize] for i in range(0, n_todo, chunksize)]
+
+    keys = list(dict.fromkeys(key for params in params_list for key in params))
+    varying = [
+        key for key in keys
+        if key not in return_columns
+        and len({repr(params.get(key)) for params in params_list}) > 1
+    ]
+
+    if sink is not None:
+        # Chunks where every run failed carry no result types of their own
+        sink.declare({
+            "scenario": "int64",
+            **{
+                key: pd.Series([params.get(key) for params in params_list]).dtype
+                for key in varying
+            },
+            "time": "float64",
+            **dict.fromkeys(return_columns, "float64"),
+            "error": object,
+        })
+
+    results = {}
+    n_done = n_total - n_todo
+    unflushed = []
+
+    def store(chunk_results, chunk_profile=None):
+        if chunk_profile is not None:
+            profile.merge(chunk_profile)
+        if sink is None:
+            for index, result, error in chunk_results:
+                results[index] = (result, error)
+            if journal is not None:
+                journal.record_many({
+                    scenario_keys[index]: (
+                        {"result": result.reset_index().to_dict("list")}
+                        if error is None else {"error": error}
+                    )
+                    for index, result, error in chunk_results
+                })
+        else:
+            sink.write(pd.concat([
+                _tidy(index, params_list[index], result, error, varying, return_columns)
+                for index, result, error in chunk_results
+            ], ignore_index=True))
+            if journal is not None:
+                unflushed.extend(
+                    (scenario_keys[index], None if error is None else {"error": error})
+                    for index, _, error in chunk_results
+                )
+                if sink.buffered_rows == 0:
+                    journal.record_many(dict(unflushed))
+                    unflushed.clear()
+
+    if workers == 1:
+        _init_worker(model_file)
+        for chunk in chunks:
+            store(*_run_chunk(chunk, return_columns, final_only, profile is not None))
+            n_done += len(chunk)
+            if progress is not None:
+                progress(n_done, n_total)
+    else:
+        # Forked workers inherit PySD and a freshly loaded model from here
+        # instead of importing and loading them again each
+        forked = multiprocessing.get_start_method() == "fork"
+        if forked:
+            _init_worker(model_file)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(model_file, not forked),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _run_chunk, chunk, return_columns, final_only, profile is not None
+                ): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    chunk_results, chunk_profile = future.result()
+                except Exception:
+                    error = traceback.format_exc()
+                    chunk_results = [(index, None, error) for index, _ in chunk]
+                    chunk_profile = None
+                store(chunk_results, chunk_profile)
+                n_done += len(chunk)
+                if progress is not None:
+                    progress(n_done, n_total)
+
+    if sink is not None:
+        sink.flush()
+        if journal is not None:
+            journal.record_many(dict(unflushed))
+        return None
+
+    for index in range(n_total):
+        if index not in results:
+            entry = journal.get(scenario_keys[index])
+            if "error" in entry:
+                results[index] = (None, entry["error"])
+            else:
+                results[index] = (pd.DataFrame(entry["result"]).set_index("time"), None)
+
+    frames = [
+        _tidy(index, params_list[index], *results[index], varying, return_columns)
+        for index in range(n_total)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=["scenario", *varying, *return_columns, "error"])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,251 @@
+"""
+Forward-mode (tangent-linear) parameter sensitivities.
+
+The batch engine equations are evaluated on dual numbers that carry, next to
+each value, its derivatives with respect to a chosen set of parameters. One
+augmented Euler run therefore yields exact d(variable)/d(param) time series
+for every stock and auxiliary, instead of 2 x P finite-difference runs.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple, Union
+
+from src.utils.batch import (
+    CONSTANTS,
+    _check_columns,
+    auxiliaries,
+    batch_params,
+    euler_step,
+    fold_constants,
+    initial_state,
+    lookup,
+)
+
+
+def _parts(x):
+    if isinstance(x, Dual):
+        return x.value, x.tangent
+    return np.asarray(x), 0.0
+
+
+class Dual:
+    """
+    Array of values of shape (n,) with tangents of shape (n_params, n).
+
+    Supports the arithmetic and NumPy functions used by the batch engine;
+    comparisons act on the values only.
+    """
+
+    def __init__(self, value, tangent):
+        self.value = value
+        self.tangent = tangent
+
+    @property
+    def size(self):
+        return np.size(self.value)
+
+    def copy(self):
+        return Dual(np.copy(self.value), np.copy(self.tangent))
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != "__call__" or kwargs:
+            return NotImplemented
+        if ufunc in _RULES:
+            return _RULES[ufunc](*[_parts(x) for x in inputs])
+        if ufunc in _COMPARISONS:
+            return ufunc(*[_parts(x)[0] for x in inputs])
+        return NotImplemented
+
+    def __add__(self, other):
+        return np.add(self, other)
+
+    def __radd__(self, other):
+        return np.add(other, self)
+
+    def __sub__(self, other):
+        return np.subtract(self, other)
+
+    def __rsub__(self, other):
+        return np.subtract(other, self)
+
+    def __mul__(self, other):
+        return np.multiply(self, other)
+
+    def __rmul__(self, other):
+        return np.multiply(other, self)
+
+    def __truediv__(self, other):
+        return np.true_divide(self, other)
+
+    def __rtruediv__(self, other):
+        return np.true_divide(other, self)
+
+    def __pow__(self, other):
+        return np.power(self, other)
+
+    def __rpow__(self, other):
+        return np.power(other, self)
+
+    def __neg__(self):
+        return np.negative(self)
+
+    def __lt__(self, other):
+        return np.less(self, other)
+
+    def __le__(self, other):
+        return np.less_equal(self, other)
+
+    def __gt__(self, other):
+        return np.greater(self, other)
+
+    def __ge__(self, other):
+        return np.greater_equal(self, other)
+
+
+def _power(x, y):
+    (u, du), (v, dv) = x, y
+    value = u ** v
+    tangent = v * u ** (v - 1) * du
+    if np.any(dv):
+        tangent = tangent + value * np.log(u) * dv
+    return Dual(value, tangent)
+
+
+def _minimum(x, y):
+    (u, du), (v, dv) = x, y
+    first = u <= v
+    return Dual(np.where(first, u, v), np.where(first, du, dv))
+
+
+def _maximum(x, y):
+    (u, du), (v, dv) = x, y
+    first = u >= v
+    return Dual(np.where(first, u, v), np.where(first, du, dv))
+
+
+_RULES = {
+    np.add: lambda x, y: Dual(x[0] + y[0], x[1] + y[1]),
+    np.subtract: lambda x, y: Dual(x[0] - y[0], x[1] - y[1]),
+    np.multiply: lambda x, y: Dual(x[0] * y[0], x[1] * y[0] + x[0] * y[1]),
+    np.true_divide: lambda x, y: Dual(
+        x[0] / y[0], (x[1] * y[0] - x[0] * y[1]) / y[0] ** 2
+    ),
+    np.power: _power,
+    np.negative: lambda x: Dual(-x[0], -x[1]),
+    np.exp: lambda x: Dual(np.exp(x[0]), np.exp(x[0]) * x[1]),
+    np.log: lambda x: Dual(np.log(x[0]), x[1] / x[0]),
+    np.minimum: _minimum,
+    np.maximum: _maximum,
+}
+
+_COMPARISONS = {
+    np.less,
+    np.less_equal,
+    np.greater,
+    np.greater_equal,
+    np.equal,
+    np.not_equal,
+}
+
+
+def _split(x, n, n_params):
+    value, tangent = _parts(x)
+    return (
+        np.broadcast_to(value, (n,)),
+        np.broadcast_to(tangent, (n_params, n)),
+    )
+
+
+def run_tangent(
+    model,
+    params: Union[Dict, List[Dict], pd.DataFrame],
+    wrt: List[str],
+    return_columns: Optional[List[str]] = None,
+    final_time: int = 120,
+    time_step: float = 1,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Simulate with Euler integration and the tangent-linear model alongside.
+
+    Parameters:
+    -----------
+    model : PySD model
+        The loaded PySD model (provides constants missing from params)
+    params : dict, list of dict or DataFrame
+        Parameter sets to simulate, see batch.batch_params
+    wrt : list
+        Constants to differentiate with respect to
+    return_columns : list, optional
+        Python names of the variables to return. Defaults to cumulative_co2,
+        cumulative_profit and rolling_margin.
+    final_time : int
+        Simulation length in months (default: 120)
+    time_step : float
+        Euler time step in months (default: 1)
+
+    Returns:
+    --------
+    values : DataFrame
+        As returned by batch.run_batch, with (variable, scenario) columns
+    sensitivities : DataFrame
+        d(variable)/d(param), indexed by time with (variable, param_name,
+        scenario) columns
+
+    Notes:
+    ------
+    Derivatives are those of the discretized (Euler) model, i.e. the exact
+    gradients of what run_batch computes. Threshold-driven stocks such as
+    duration_below_margin_threshold are piecewise constant in the
+    parameters, so their derivative is zero almost everywhere.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "rolling_margin"
+        ]
+    _check_columns(return_columns)
+    unknown = [name for name in wrt if name not in CONSTANTS]
+    if unknown:
+        raise NameError(f"{unknown} are not constants of the model.")
+
+    c = batch_params(model, params)
+    n = np.size(c["carbon_tax_rate"])
+    n_params = len(wrt)
+    for k, name in enumerate(wrt):
+        seed = np.zeros((n_params, n))
+        seed[k] = 1
+        c[name] = Dual(c[name], seed)
+    c = fold_constants(c)
+
+    n_steps = int(round(final_time / time_step))
+    values = {name: [] for name in return_columns}
+    tangents = {name: [] for name in return_columns}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = initial_state(c)
+        for i in range(n_steps + 1):
+            a = auxiliaries(c, s)
+            for name in return_columns:
+                value, tangent = _split(lookup(name, c, s, a), n, n_params)
+                values[name].append(value)
+                tangents[name].append(tangent.reshape(-1))
+            if i < n_steps:
+                s = euler_step(c, s, a, time_step)
+
+    index = pd.Index(np.arange(n_steps + 1) * time_step, name="time")
+    values = pd.DataFrame(
+        np.concatenate([np.stack(values[name]) for name in return_columns], axis=1),
+        index=index,
+        columns=pd.MultiIndex.from_product(
+            [return_columns, range(n)], names=["variable", "scenario"]
+        ),
+    )
+    sensitivities = pd.DataFrame(
+        np.concatenate([np.stack(tangents[name]) for name in return_columns], axis=1),
+        index=index,
+        columns=pd.MultiIndex.from_product(
+            [return_columns, wrt, range(n)], names=["variable", "param_name", "scenario"]
+        ),
+    )
+    return values, sensitivities
@@ -5,11 +5,24 @@ This module provides functions to compare adaptive tax trajectories against
 static taxes at the time-averaged level.
 """
 
+import itertools
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import Callable, Dict, Optional
-from pysd.py_backend.output import ModelOutput
+from typing import Callable, Dict, List, Optional
+
+from src.utils.batch import (
+    CONSTANTS,
+    STOCKS,
+    auxiliaries,
+    batch_params,
+    euler_step,
+    fold_constants,
+    fold_tax,
+    initial_state,
+    lookup,
+)
+from src.utils.jit import run_compiled
+from src.utils.stepping import step
 
 
 def compare_adaptive_tax_vs_static(
@@ -19,6 +32,7 @@ def compare_adaptive_tax_vs_static(
     return_columns: Optional[list] = None,
     final_time: int = 120,
     initial_tax: Optional[float] = None,
+    immediate_tax: bool = False,
     **adjustment_kwargs
 ) -> Dict:
     """
@@ -45,6 +59,11 @@ def compare_adaptive_tax_vs_static(
         Simulation length in months (default: 120)
     initial_tax : float, optional
         Starting tax rate. If None, uses base_params["carbon_tax_rate"]
+    immediate_tax : bool
+        If True, every tax rate applies from the month it is chosen for, by
+        invalidating the step-cached values that depend on it (see
+        stepping.step). By default it takes effect one month later, as with
+        model.step, which the batch and tree versions reproduce.
     **adjustment_kwargs
         Additional keyword arguments passed to tax_adjustment_func
     
@@ -62,6 +81,8 @@ def compare_adaptive_tax_vs_static(
     if initial_tax is None:
         initial_tax = base_params["carbon_tax_rate"]
     
+    from pysd.py_backend.output import ModelOutput
+
     # Set up stepper for adaptive trajectory
     output = ModelOutput()
     model.set_stepper(
@@ -80,7 +101,10 @@ def compare_adaptive_tax_vs_static(
         tax_trajectory.append(tax_rate_current)
         
         # Step the model with current tax
-        model.step(1, {"carbon_tax_rate": tax_rate_current})
+        if immediate_tax:
+            step(model, {"carbon_tax_rate": tax_rate_current})
+        else:
+            model.step(1, {"carbon_tax_rate": tax_rate_current})
         
         # Get current model state by accessing variables directly
         # This allows the adjustment function to access current margin, emissions, etc.
@@ -113,11 +137,6 @@ def compare_adaptive_tax_vs_static(
     # Collect adaptive trajectory results (only after all steps are done)
     adaptive_results = output.collect(model)
     
-    # Extract final values
-    co2_adaptive = adaptive_results["Cumulative CO2"].iloc[-1]
-    profit_adaptive = adaptive_results["Cumulative Profit"].iloc[-1]
-    viability_adaptive = adaptive_results["Viability Flag"].iloc[-1]
-    
     # Calculate time-averaged tax
     time_avg_tax = np.mean(tax_trajectory)
     
@@ -126,6 +145,22 @@ def compare_adaptive_tax_vs_static(
     params_static["carbon_tax_rate"] = time_avg_tax
     static_results = model.run(params=params_static, return_columns=return_columns)
     
+    return _comparison_result(tax_trajectory, adaptive_results, static_results)
+
+
+def _comparison_result(tax_trajectory, adaptive_results, static_results) -> Dict:
+    """
+    Build the comparison dict of compare_adaptive_tax_vs_static from the
+    adaptive and static run results.
+    """
+    # Extract final values
+    co2_adaptive = adaptive_results["Cumulative CO2"].iloc[-1]
+    profit_adaptive = adaptive_results["Cumulative Profit"].iloc[-1]
+    viability_adaptive = adaptive_results["Viability Flag"].iloc[-1]
+    
+    # Calculate time-averaged tax
+    time_avg_tax = np.mean(tax_trajectory)
+    
     co2_static = static_results["cumulative_co2"].iloc[-1]
     profit_static = static_results["cumulative_profit"].iloc[-1]
     viability_static = static_results["viability_flag"].iloc[-1]
@@ -180,6 +215,366 @@ def compare_adaptive_tax_vs_static(
     }
 
 
+def _stack_configs(configs):
+    """
+    Stack rule keyword arguments into arrays of shape (n_configs,). Arrays
+    of equal shape (e.g. target emission paths) are stacked along a last
+    axis of length n_configs. Other values (e.g. callables) must be shared
+    by all configs.
+    """
+    kwargs = {}
+    for key in dict.fromkeys(key for config in configs for key in config):
+        values = [config[key] for config in configs]
+        if all(isinstance(v, (int, float, np.integer, np.floating)) for v in values):
+            kwargs[key] = np.array(values, dtype=float)
+        elif all(isinstance(v, np.ndarray) for v in values) \
+                and len({v.shape for v in values}) == 1:
+            kwargs[key] = np.stack(values, axis=-1)
+        elif all(v is values[0] for v in values):
+            kwargs[key] = values[0]
+        else:
+            raise ValueError(
+                f"Rule argument '{key}' must be numeric or shared by all configurations."
+            )
+    return kwargs
+
+
+ADAPTIVE_COLUMNS = {
+    "Cumulative CO2": "cumulative_co2",
+    "Cumulative Profit": "cumulative_profit",
+    "Viability Flag": "viability_flag",
+}
+
+
+def _batch_rule(tax_adjustment_func, configs, vectorized):
+    """
+    Wrap a rule so that it maps arrays of shape (n_configs,) to new taxes.
+    """
+    if vectorized:
+        kwargs = _stack_configs(configs)
+        
+        def rule(t, tax, model_state):
+            return tax_adjustment_func(t, tax, model_state, **kwargs)
+    else:
+        def rule(t, tax, model_state):
+            return [
+                tax_adjustment_func(
+                    t, tax[i], {key: value[i] if key != "time" else value
+                                for key, value in model_state.items()},
+                    **configs[i]
+                )
+                for i in range(len(configs))
+            ]
+    return rule
+
+
+def _batch_results(model, base_params, tax_trajectory, records, return_columns,
+                   final_time):
+    """
+    Run the static comparisons and assemble one result dict per configuration.
+    """
+    # Static runs at the time-averaged tax of every configuration
+    static_params = [
+        dict(params, carbon_tax_rate=avg)
+        for params, avg in zip(base_params, tax_trajectory.mean(axis=0))
+    ]
+    static_all = run_compiled(
+        model, static_params, return_columns=return_columns, final_time=final_time
+    )
+    
+    time_index = pd.Index(np.arange(final_time + 1), name="time")
+    results = []
+    for i in range(len(static_params)):
+        adaptive_results = pd.DataFrame(
+            {name: records[name][:, i] for name in ADAPTIVE_COLUMNS}, index=time_index
+        )
+        static_results = static_all.xs(i, axis=1, level="scenario")
+        static_results.columns = list(static_results.columns)
+        results.append(_comparison_result(
+            list(tax_trajectory[:, i]), adaptive_results, static_results
+        ))
+    return results
+
+
+def compare_adaptive_tax_vs_static_batch(
+    model,
+    base_params,
+    tax_adjustment_func: Callable,
+    configs: List[Dict],
+    return_columns: Optional[list] = None,
+    final_time: int = 120,
+    initial_tax=None,
+    vectorized: bool = True,
+    journal=None,
+    checkpoint_name: Optional[str] = None,
+    checkpoint_every: int = 12,
+) -> List[Dict]:
+    """
+    Batched equivalent of compare_adaptive_tax_vs_static for many rule
+    configurations at once, on the NumPy batch engine.
+    
+    All configurations advance through the same monthly Euler step and the
+    adjustment rule is evaluated once per month on arrays: current_tax and the
+    values of model_state are arrays of shape (n_configs,), and numeric rule
+    arguments are stacked into arrays of the same shape.
+    
+    Parameters:
+    -----------
+    model : PySD model
+        The loaded PySD model (provides constants missing from base_params)
+    base_params : dict or list of dict
+        Base parameters, shared or one dict per configuration
+    tax_adjustment_func : callable
+        Tax adjustment rule with the signature described in
+        compare_adaptive_tax_vs_static
+    configs : list of dict
+        Keyword arguments of tax_adjustment_func, one dict per configuration
+    return_columns : list, optional
+        Columns to return from the static runs. Defaults to cumulative metrics.
+    final_time : int
+        Simulation length in months (default: 120)
+    initial_tax : float or list, optional
+        Starting tax rate(s). If None, uses base_params["carbon_tax_rate"]
+    vectorized : bool
+        If False, the rule is called once per configuration with scalars,
+        for rules that only support scalar inputs.
+    journal : journal.SweepJournal, optional
+        If given, the stocks, taxes and recorded outputs are checkpointed
+        every checkpoint_every months, and an interrupted run restarts from
+        its last checkpoint. The checkpoint is removed once the run ends.
+    checkpoint_name : str, optional
+        Name of the checkpoint. Defaults to the rule name and a key of
+        base_params, configs, initial_tax and final_time; pass a name when
+        configs hold callables, whose keys are not stable across processes.
+    checkpoint_every : int
+        Months between checkpoints (default: 12)
+    
+    Returns:
+    --------
+    list with one compare_adaptive_tax_vs_static result dict per configuration.
+    "adaptive_results" only holds the Cumulative CO2, Cumulative Profit and
+    Viability Flag columns. Stocks are initialized at the starting tax, and
+    like the PySD stepper each new tax applies from the month after the rule
+    chooses it.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+    
+    n = len(configs)
+    if isinstance(base_params, dict):
+        base_params = [base_params] * n
+    if initial_tax is None:
+        initial_tax = [params["carbon_tax_rate"] for params in base_params]
+    tax = np.broadcast_to(np.asarray(initial_tax, dtype=float), (n,)).copy()
+    
+    params_list = [
+        dict(params, carbon_tax_rate=t) for params, t in zip(base_params, tax)
+    ]
+    c = fold_constants(batch_params(model, params_list))
+    
+    rule = _batch_rule(tax_adjustment_func, configs, vectorized)
+    tax_trajectory = np.empty((final_time, n))
+    records = {name: np.empty((final_time + 1, n)) for name in ADAPTIVE_COLUMNS}
+    
+    if journal is not None and checkpoint_name is None:
+        checkpoint_name = tax_adjustment_func.__name__ + "-" + journal.key(
+            {"base_params": base_params, "configs": configs, "initial_tax": tax},
+            final_time=final_time,
+        )
+    state = journal.load_state(checkpoint_name) if journal is not None else None
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if state is None:
+            start = 0
+            s = initial_state(c)
+            applied_tax = tax
+        else:
+            start = int(state["time"])
+            s = {name: state["stock_" + name] for name in STOCKS}
+            tax, applied_tax = state["tax"], state["applied_tax"]
+            tax_trajectory[:start] = state["tax_trajectory"]
+            for i, name in enumerate(ADAPTIVE_COLUMNS):
+                records[name][:start] = state["records"][i]
+        for t in range(start, final_time):
+            tax_trajectory[t] = tax
+            c["carbon_tax_rate"] = applied_tax
+            fold_tax(c)
+            a = auxiliaries(c, s)
+            for name, py_name in ADAPTIVE_COLUMNS.items():
+                records[name][t] = lookup(py_name, c, s, a)
+            s = euler_step(c, s, a, 1)
+            
+            model_state = {
+                'time': t,
+                'cumulative_co2': s["cumulative_co2"],
+                'cumulative_profit': s["cumulative_profit"],
+                'rolling_margin': s["rolling_margin"],
+            }
+            # PySD's step cache still holds the values computed at the last
+            # output time when model.step sets a new tax, so a new tax only
+            # takes effect one month after it is chosen
+            applied_tax = tax
+            tax = np.broadcast_to(
+                np.asarray(rule(t, tax, model_state), dtype=float), (n,)
+            ).copy()
+            
+            if journal is not None and (t + 1) % checkpoint_every == 0:
+                journal.save_state(
+                    checkpoint_name,
+                    time=t + 1,
+                    tax=tax,
+                    applied_tax=applied_tax,
+                    tax_trajectory=tax_trajectory[:t + 1],
+                    records=np.stack([records[name][:t + 1] for name in ADAPTIVE_COLUMNS]),
+                    **{"stock_" + name: s[name] for name in STOCKS},
+                )
+        
+        a = auxiliaries(c, s)
+        for name, py_name in ADAPTIVE_COLUMNS.items():
+            records[name][final_time] = lookup(py_name, c, s, a)
+    if journal is not None:
+        journal.drop_state(checkpoint_name)
+
+    return _batch_results(
+        model, base_params, tax_trajectory, records, return_columns, final_time
+    )
+
+
+def _group(*keys):
+    """
+    Index of the first member of every group of equal keys, and the group
+    of every element (groups ordered by key).
+    """
+    order = np.lexsort(keys[::-1])
+    starts = np.zeros(len(order), dtype=bool)
+    starts[0] = True
+    for key in keys:
+        ordered = key[order]
+        starts[1:] |= ordered[1:] != ordered[:-1]
+    group = np.empty(len(order), dtype=int)
+    group[order] = np.cumsum(starts) - 1
+    return order[starts], group
+
+
+def compare_adaptive_tax_vs_static_tree(
+    model,
+    base_params,
+    tax_adjustment_func: Callable,
+    configs: List[Dict],
+    return_columns: Optional[list] = None,
+    final_time: int = 120,
+    initial_tax=None,
+    vectorized: bool = True,
+) -> List[Dict]:
+    """
+    compare_adaptive_tax_vs_static_batch that simulates shared trajectory
+    prefixes only once.
+
+    Configurations with the same constants and initial tax start in one
+    branch. Every month the rule is evaluated for all configurations, and a
+    branch only splits into child branches when its configurations choose
+    different taxes, so rules that decide annually (margin_based_rule_batch,
+    emission_path_rule_batch) simulate each shared segment once. The Euler
+    step then costs O(n_branches) instead of O(n_configs), and the static
+    comparison runs and result tables are built once per leaf branch.
+
+    Parameters and results are those of compare_adaptive_tax_vs_static_batch,
+    except that configurations with identical trajectories get copies of
+    the same result dict, sharing its DataFrames.
+    """
+    if return_columns is None:
+        return_columns = [
+            "cumulative_co2",
+            "cumulative_profit",
+            "viability_flag"
+        ]
+
+    n = len(configs)
+    if isinstance(base_params, dict):
+        base_params = [base_params] * n
+    if initial_tax is None:
+        initial_tax = [params["carbon_tax_rate"] for params in base_params]
+    tax = np.broadcast_to(np.asarray(initial_tax, dtype=float), (n,)).copy()
+
+    params_list = [
+        dict(params, carbon_tax_rate=t) for params, t in zip(base_params, tax)
+    ]
+    constants = batch_params(model, params_list)
+    _, first, branch = np.unique(
+        np.stack([constants[name] for name in CONSTANTS], axis=1),
+        axis=0, return_index=True, return_inverse=True,
+    )
+    branch = branch.ravel()
+    c = fold_constants({name: value[first] for name, value in constants.items()})
+
+    rule = _batch_rule(tax_adjustment_func, configs, vectorized)
+    tax_trajectory = np.empty((final_time, n))
+    records = {name: np.empty((final_time + 1, n)) for name in ADAPTIVE_COLUMNS}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = initial_state(c)
+        branch_tax = tax[first]
+        applied_tax = branch_tax
+        for t in range(final_time):
+            tax_trajectory[t] = branch_tax[branch]
+            c["carbon_tax_rate"] = applied_tax
+            fold_tax(c)
+            a = auxiliaries(c, s)
+            for name, py_name in ADAPTIVE_COLUMNS.items():
+                records[name][t] = np.broadcast_to(
+                    lookup(py_name, c, s, a), branch_tax.shape
+                )[branch]
+            s = euler_step(c, s, a, 1)
+
+            model_state = {
+                'time': t,
+                'cumulative_co2': s["cumulative_co2"][branch],
+                'cumulative_profit': s["cumulative_profit"][branch],
+                'rolling_margin': s["rolling_margin"][branch],
+            }
+            new_tax = np.broadcast_to(
+                np.asarray(rule(t, branch_tax[branch], model_state), dtype=float), (n,)
+            )
+
+            # A new tax takes effect one month after it is chosen, as in
+            # compare_adaptive_tax_vs_static_batch
+            applied_tax = branch_tax
+            if np.array_equal(new_tax, new_tax[first][branch]):
+                branch_tax = new_tax[first]
+                continue
+
+            # Branch wherever configurations of a branch choose different taxes
+            first, children = _group(branch, new_tax)
+            parents = branch[first]
+            branch = children
+            s = {name: value[parents] for name, value in s.items()}
+            c = {name: value[parents] for name, value in c.items()}
+            applied_tax = applied_tax[parents]
+            branch_tax = new_tax[first]
+
+        a = auxiliaries(c, s)
+        for name, py_name in ADAPTIVE_COLUMNS.items():
+            records[name][final_time] = np.broadcast_to(
+                lookup(py_name, c, s, a), branch_tax.shape
+            )[branch]
+
+    # Configurations that end in the same branch followed the same path, so
+    # the static run and result are computed once per leaf
+    leaf_results = _batch_results(
+        model,
+        [base_params[i] for i in first],
+        tax_trajectory[:, first],
+        {name: values[:, first] for name, values in records.items()},
+        return_columns,
+        final_time,
+    )
+    return [dict(leaf_results[leaf]) for leaf in branch]
+
+
 # Example tax adjustment functions for the 4 rules:
 
 def step_increase_rule(t: int, current_tax: float, model_state: Dict, 
@@ -292,6 +687,94 @@ def emission_path_rule(t: int, current_tax: float, model_state: Dict,
         return current_tax
 
 
+# Array-native versions of the 4 rules, for compare_adaptive_tax_vs_static_batch.
+# current_tax, the model_state values and the rule parameters are arrays of
+# shape (n_configs,) (or scalars, which broadcast).
+
+def step_increase_rule_batch(t: int, current_tax: np.ndarray, model_state: Dict,
+                             step_size, max_tax, **kwargs) -> np.ndarray:
+    """
+    Rule 1 on arrays, see step_increase_rule.
+    """
+    return np.minimum(current_tax + np.asarray(step_size) / 12, max_tax)
+
+
+def percentage_growth_rule_batch(t: int, current_tax: np.ndarray, model_state: Dict,
+                                 annual_growth_rate, **kwargs) -> np.ndarray:
+    """
+    Rule 2 on arrays, see percentage_growth_rule.
+    """
+    return current_tax * (1 + np.asarray(annual_growth_rate)) ** (1/12)
+
+
+def _band_adjustment(t, current_tax, value, target, band, tax_increase, tax_decrease):
+    """
+    Annual band rule shared by rules 3 and 4: raise the tax above the band,
+    lower it (not below 0) under the band, otherwise keep it.
+    """
+    if value is None or not (t % 12 == 0 and t > 0):
+        return current_tax
+    return np.where(
+        value > target + band,
+        current_tax + tax_increase,
+        np.where(
+            value < target - band,
+            np.maximum(0, current_tax - tax_decrease),
+            current_tax,
+        ),
+    )
+
+
+def margin_based_rule_batch(t: int, current_tax: np.ndarray, model_state: Dict,
+                            target_margin, margin_band,
+                            tax_increase, tax_decrease,
+                            **kwargs) -> np.ndarray:
+    """
+    Rule 3 on arrays, see margin_based_rule.
+    """
+    return _band_adjustment(
+        t, current_tax, model_state.get('rolling_margin'),
+        target_margin, margin_band, tax_increase, tax_decrease,
+    )
+
+
+def emission_path_rule_batch(t: int, current_tax: np.ndarray, model_state: Dict,
+                             target_emissions: np.ndarray, emission_band,
+                             tax_increase, tax_decrease,
+                             **kwargs) -> np.ndarray:
+    """
+    Rule 4 on arrays, see emission_path_rule.
+    
+    Parameters:
+    -----------
+    target_emissions : array
+        Target cumulative emissions path, target_emissions[t] being the
+        target at time t (see target_emissions_path). Shape (final_time,)
+        or (final_time, n_configs).
+    """
+    return _band_adjustment(
+        t, current_tax, model_state.get('cumulative_co2'),
+        target_emissions[t], emission_band, tax_increase, tax_decrease,
+    )
+
+
+def target_emissions_path(target_emissions_func: Callable, final_time: int = 120) -> np.ndarray:
+    """
+    Precompute target_emissions_func(t) for t = 0 .. final_time - 1.
+    """
+    return np.array([target_emissions_func(t) for t in range(final_time)], dtype=float)
+
+
+def config_grid(**values) -> List[Dict]:
+    """
+    All combinations of rule parameter values, e.g.
+    config_grid(step_size=[5, 120], max_tax=[4000, 5000]) gives 4 configs.
+    """
+    return [
+        dict(zip(values, combination))
+        for combination in itertools.product(*values.values())
+    ]
+
 def plot_comparison(result: Dict, rule_name: str = "Adaptive Tax", 
                     save_path: Optional[str] = None, figsize: tuple = (12, 10)) -> None:
     """
@@ -317,6 +800,8 @@ def plot_comparison(result: Dict, rule_name: str = "Adaptive Tax",
     tax_trajectory = result["tax_trajectory"]
     time_avg_tax = result["time_avg_tax"]
     
+    import matplotlib.pyplot as plt
+
     # Create figure with 2x2 subplots
     fig, axes = plt.subplots(2, 2, figsize=figsize)
     
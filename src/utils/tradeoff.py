@@ -0,0 +1,167 @@
+"""
+Adaptive sampling of the CO2 reduction vs profit change tradeoff curve.
+
+Instead of a dense uniform tax grid, taxes are added where the curve bends
+(the interpolant mispredicts a new midpoint by more than a tolerance) or
+where viability changes, and a monotone (PCHIP) interpolant of the samples
+is returned for cheap queries.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import PchipInterpolator
+from typing import Dict, Tuple
+
+from src.utils.summary import summarize_batch
+
+
+class TradeoffCurve:
+    """
+    Sampled tradeoff curve with monotone interpolants.
+
+    Attributes:
+    -----------
+    samples : DataFrame
+        One row per simulated tax with the columns of the notebooks'
+        results_df: tax, co2, profit, co2_reduction_pct, profit_change_pct
+        and viable, sorted by tax.
+    co2_base, profit_base : float
+        Baseline cumulative CO2 and profit the percentages refer to.
+    """
+
+    def __init__(self, samples: pd.DataFrame, co2_base: float, profit_base: float):
+        self.samples = samples.sort_values("tax").reset_index(drop=True)
+        self.co2_base = co2_base
+        self.profit_base = profit_base
+        tax = self.samples["tax"].to_numpy()
+        self._co2_reduction = PchipInterpolator(tax, self.samples["co2_reduction_pct"])
+        self._profit_change = PchipInterpolator(tax, self.samples["profit_change_pct"])
+        by_reduction = self.samples.drop_duplicates("co2_reduction_pct").sort_values(
+            "co2_reduction_pct"
+        )
+        self._profit_at_reduction = PchipInterpolator(
+            by_reduction["co2_reduction_pct"], by_reduction["profit_change_pct"]
+        )
+
+    def co2_reduction_pct(self, tax):
+        """
+        Interpolated CO2 reduction vs baseline (%) at the given tax(es).
+        """
+        return self._co2_reduction(tax)
+
+    def profit_change_pct(self, tax):
+        """
+        Interpolated profit change vs baseline (%) at the given tax(es).
+        """
+        return self._profit_change(tax)
+
+    def profit_at_reduction(self, co2_reduction_pct):
+        """
+        Interpolated profit change (%) along the curve at a CO2 reduction (%).
+        """
+        return self._profit_at_reduction(co2_reduction_pct)
+
+
+def _evaluate(model, base_params, taxes, final_time):
+    summary = summarize_batch(
+        model,
+        dict(base_params, carbon_tax_rate=np.asarray(taxes, dtype=float)),
+        ["cumulative_co2", "cumulative_profit", "viability_flag"],
+        final_time=final_time,
+    )
+    return pd.DataFrame({
+        "tax": taxes,
+        "co2": summary.final["cumulative_co2"],
+        "profit": summary.final["cumulative_profit"],
+        "viable": summary.final["viability_flag"],
+    })
+
+
+def build_tradeoff_curve(
+    model,
+    base_params: Dict,
+    tax_range: Tuple[float, float] = (0, 6500),
+    tol: float = 0.05,
+    initial_points: int = 5,
+    min_spacing: float = 1.0,
+    max_runs: int = 200,
+    final_time: int = 120,
+) -> TradeoffCurve:
+    """
+    Build the tradeoff curve by adaptive refinement of the tax axis.
+
+    Parameters:
+    -----------
+    model : PySD model
+        The loaded PySD model (provides constants missing from base_params)
+    base_params : dict
+        Base parameters; the run at base_params["carbon_tax_rate"] is the
+        baseline, as in the tradeoff notebook
+    tax_range : tuple
+        Lowest and highest tax to sample
+    tol : float
+        Interpolation error tolerance in percentage points: an interval is
+        split while interpolating its midpoint misses the simulated
+        co2_reduction_pct or profit_change_pct by more than tol
+    initial_points : int
+        Number of evenly spaced taxes to start from
+    min_spacing : float
+        Intervals narrower than this (in ¥/tCO₂) are not split further
+    max_runs : int
+        Budget of simulated taxes
+    final_time : int
+        Simulation length in months (default: 120)
+
+    Returns:
+    --------
+    TradeoffCurve
+    """
+    baseline = summarize_batch(
+        model, base_params, ["cumulative_co2", "cumulative_profit"], final_time=final_time
+    )
+    co2_base = baseline.final["cumulative_co2"][0]
+    profit_base = baseline.final["cumulative_profit"][0]
+
+    def percentages(df):
+        df["co2_reduction_pct"] = 100 * (1 - df["co2"] / co2_base)
+        df["profit_change_pct"] = 100 * ((df["profit"] - profit_base) / profit_base)
+        return df
+
+    taxes = np.linspace(tax_range[0], tax_range[1], initial_points)
+    samples = percentages(_evaluate(model, base_params, taxes, final_time))
+    pending = list(zip(taxes[:-1], taxes[1:]))
+
+    while pending and len(samples) < max_runs:
+        pending = pending[:max_runs - len(samples)]
+        mids = np.array([(low + high) / 2 for low, high in pending])
+        new = percentages(_evaluate(model, base_params, mids, final_time))
+
+        # Predict the midpoints from the samples gathered so far
+        ordered = samples.sort_values("tax")
+        predicted = {
+            column: PchipInterpolator(ordered["tax"], ordered[column])(mids)
+            for column in ["co2_reduction_pct", "profit_change_pct"]
+        }
+        error = np.maximum(
+            np.abs(predicted["co2_reduction_pct"] - new["co2_reduction_pct"]),
+            np.abs(predicted["profit_change_pct"] - new["profit_change_pct"]),
+        )
+        viable = dict(zip(ordered["tax"], ordered["viable"]))
+
+        next_pending = []
+        for (low, high), mid, err, mid_viable in zip(pending, mids, error, new["viable"]):
+            if (high - low) / 2 < min_spacing:
+                continue
+            if err > tol:
+                next_pending += [(low, mid), (mid, high)]
+            else:
+                # Keep bisecting towards a change of viability
+                if viable[low] != mid_viable:
+                    next_pending.append((low, mid))
+                if mid_viable != viable[high]:
+                    next_pending.append((mid, high))
+
+        samples = pd.concat([samples, new], ignore_index=True)
+        pending = next_pending
+
+    return TradeoffCurve(samples, co2_base, profit_base)